@@ -0,0 +1,220 @@
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from cache import DEFAULT_CACHE_DIR, DEFAULT_MAX_BYTES, DictionaryCache
+from excel_diff import AUX_SHEETS, ExcelDiff, ExcelReport, read_dictionary
+
+SUMMARY_FIELDS = [
+    "project",
+    "old",
+    "new",
+    "new_fields",
+    "dropped_fields",
+    "dangerous_dropped_fields",
+    "changed_fields",
+    "important_changes",
+    "needs_review",
+    "dangerous_drops",
+    "output",
+    "seconds",
+    "error",
+]
+
+
+def load_manifest(path):
+    # {"projects": {"name": ["v1.xlsx", "v2.xlsx", ...]}}, each list in
+    # release order; relative paths are relative to the manifest
+    path = Path(path)
+    with open(path) as f:
+        manifest = json.load(f)
+    if not isinstance(manifest, dict) or "projects" not in manifest:
+        raise ValueError('the manifest needs a "projects" key')
+    if not isinstance(manifest["projects"], dict):
+        raise ValueError('"projects" must map project names to lists of versions')
+    for name, versions in manifest["projects"].items():
+        if not isinstance(versions, list) or not all(
+            isinstance(version, str) for version in versions
+        ):
+            raise ValueError(f"project {name} must be a list of file paths")
+    return {
+        name: [str(path.parent / version) for version in versions]
+        for name, versions in manifest["projects"].items()
+    }
+
+
+def chain_pairs(projects):
+    # Consecutive releases of each project: v1->v2, v2->v3, ...
+    return [
+        (name, old, new)
+        for name, versions in projects.items()
+        for old, new in zip(versions, versions[1:])
+    ]
+
+
+def parse_file(cache_dir, max_bytes, path):
+    # Every file is parsed once, with the auxiliary sheets, into the cache;
+    # the diff tasks then only load the two frames they compare
+    started = time.perf_counter()
+    DictionaryCache(cache_dir, max_bytes).read(path, AUX_SHEETS, read_dictionary)
+    return path, time.perf_counter() - started
+
+
+def diff_pair(cache_dir, max_bytes, project, old, new, out_dir, write_report, options):
+    started = time.perf_counter()
+    summary = dict.fromkeys(SUMMARY_FIELDS, "")
+    summary.update(project=project, old=old, new=new)
+    try:
+        cache = DictionaryCache(cache_dir, max_bytes)
+        df_old, aux = cache.read(old, AUX_SHEETS, read_dictionary)
+        df_new, _ = cache.read(new, AUX_SHEETS, read_dictionary)
+        diff_class = ExcelDiff(
+            old, new, detect_renames=options.get("detect_renames", False)
+        )
+        diff_class.set_frames(df_old, df_new)
+        diff_class.aux_sheets = aux
+        result = diff_class.compute()
+        if write_report:
+            fname = Path(out_dir) / project / f"{Path(old).stem}__{Path(new).stem}.xlsx"
+            fname.parent.mkdir(parents=True, exist_ok=True)
+            ExcelReport(result, streaming=options.get("streaming", False)).save(
+                str(fname)
+            )
+            summary["output"] = str(fname)
+        summary.update(
+            new_fields=len(result.new_rows),
+            dropped_fields=len(result.dropped_rows),
+            dangerous_dropped_fields=len(result.dangerous_dropped_rows),
+            changed_fields=len(result.changes),
+            important_changes=len(result.important_changes),
+            needs_review=result.needs_review,
+            dangerous_drops=[str(row.field) for row in result.dangerous_dropped_rows],
+        )
+    except Exception as err:
+        summary["error"] = f"{type(err).__name__}: {err}"
+    summary["seconds"] = round(time.perf_counter() - started, 3)
+    return summary
+
+
+def run_batch(
+    projects,
+    out_dir,
+    workers=None,
+    write_report=True,
+    cache_dir=DEFAULT_CACHE_DIR,
+    max_bytes=DEFAULT_MAX_BYTES,
+    **options,
+):
+    pairs = chain_pairs(projects)
+    files = sorted({path for _, old, new in pairs for path in (old, new)})
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        # Parsing failures are reported by the diff tasks that need the file
+        parses = [pool.submit(parse_file, cache_dir, max_bytes, path) for path in files]
+        for future in parses:
+            try:
+                future.result()
+            except Exception:
+                pass
+        diffs = [
+            pool.submit(
+                diff_pair,
+                cache_dir,
+                max_bytes,
+                project,
+                old,
+                new,
+                out_dir,
+                write_report,
+                options,
+            )
+            for project, old, new in pairs
+        ]
+        return [future.result() for future in diffs]
+
+
+def write_summary(summaries, out_dir):
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    with open(out_dir / "batch_summary.json", "w") as f:
+        json.dump(summaries, f, indent=2)
+    with open(out_dir / "batch_summary.csv", "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=SUMMARY_FIELDS)
+        writer.writeheader()
+        for summary in summaries:
+            writer.writerow(
+                dict(
+                    summary, dangerous_drops=" ".join(summary["dangerous_drops"] or [])
+                )
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Diff consecutive releases of one or more REDCap projects in parallel"
+    )
+    parser.add_argument(
+        "versions",
+        nargs="*",
+        help="data dictionaries of one project in release order (instead of --manifest)",
+    )
+    parser.add_argument("--manifest", help="projects JSON with each project's releases")
+    parser.add_argument(
+        "--project", default="project", help="name for the versions list"
+    )
+    parser.add_argument("--out", default="batch_output", help="folder for the outputs")
+    parser.add_argument(
+        "--workers", type=int, default=os.cpu_count(), help="worker processes"
+    )
+    parser.add_argument(
+        "--check",
+        action="store_true",
+        help="no workbooks, only the summary; exit 1 if any pair needs review",
+    )
+    parser.add_argument("--streaming", action="store_true")
+    parser.add_argument("--detect-renames", action="store_true")
+    args = parser.parse_args()
+
+    if args.manifest:
+        try:
+            projects = load_manifest(args.manifest)
+        except (OSError, ValueError) as err:
+            parser.error(f"could not load the manifest {args.manifest}: {err}")
+    elif len(args.versions) >= 2:
+        projects = {args.project: args.versions}
+    else:
+        parser.error("give --manifest or at least two versions")
+
+    summaries = run_batch(
+        projects,
+        args.out,
+        workers=args.workers,
+        write_report=not args.check,
+        streaming=args.streaming,
+        detect_renames=args.detect_renames,
+    )
+    write_summary(summaries, args.out)
+    for summary in summaries:
+        pair = f"{summary['project']}: {Path(summary['old']).name} -> {Path(summary['new']).name}"
+        if summary["error"]:
+            print(f"{pair}: {summary['error']}")
+            continue
+        print(
+            f"{pair}: {summary['new_fields']} new, {summary['dropped_fields']} dropped "
+            f"({summary['dangerous_dropped_fields']} dangerous), "
+            f"{summary['changed_fields']} changed"
+        )
+    print(f"Summary written to {Path(args.out) / 'batch_summary.json'}")
+    if any(summary["error"] for summary in summaries):
+        return 1
+    if args.check and any(summary["needs_review"] for summary in summaries):
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
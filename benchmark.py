@@ -0,0 +1,266 @@
+import argparse
+import io
+import json
+import sys
+import time
+import tracemalloc
+import warnings
+
+from excel_diff import (
+    CATEGORICAL_COLS,
+    CHOICES_COL,
+    ExcelDiff,
+    ExcelReport,
+    compare_rows,
+    format_choice,
+    match_fields,
+    share_categories,
+)
+from synthetic import generate_pair
+
+
+def legacy_records(result):
+    # The nested dict layout change records used before they were slotted
+    changes = {}
+    for field, change in result.changes.items():
+        changed_cols = []
+        for column in change.changed_cols:
+            col_change_dict = {
+                "col_name": column.col_name,
+                "col_num": column.col_num,
+                "val": column.new_val,
+            }
+            if column.col_name == CHOICES_COL and column.choices is not None:
+                col_change_dict["old_options"] = [
+                    format_choice(*opt) for opt in column.choices.old_options
+                ]
+                col_change_dict["new_options"] = [
+                    format_choice(*opt) for opt in column.choices.new_options
+                ]
+            else:
+                col_change_dict["old_val"] = column.old_val
+                col_change_dict["new_val"] = column.new_val
+            changed_cols.append(col_change_dict)
+        changes[field] = {
+            "field": field,
+            "row_num": change.row_num,
+            "changed_cols": changed_cols,
+            "old_row_num": change.old_row_num,
+        }
+    return changes
+
+
+def traced_size(build):
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    built = build()
+    size = sum(
+        stat.size_diff
+        for stat in tracemalloc.take_snapshot().compare_to(before, "filename")
+    )
+    tracemalloc.stop()
+    return built, size
+
+
+def bench_records(n_fields):
+    # Every field changed, so the records dominate what the diff keeps alive
+    df_old, df_new = generate_pair(n_fields, changed_share=1.0)
+    diff_class = ExcelDiff.from_frames(df_old, df_new)
+    result = diff_class.compute()
+    _, record_size = traced_size(lambda: diff_class.collect_changes(result.match))
+    _, legacy_size = traced_size(lambda: legacy_records(result))
+    return record_size, legacy_size
+
+
+def bench_dtypes(n_fields, repeat):
+    # Frame memory and compare time with the low-cardinality columns as plain
+    # strings and as shared categoricals
+    df_old, df_new = generate_pair(n_fields, extra_columns=1)
+    pairs = match_fields(df_old, df_new).pairs
+    columns = df_new.columns.tolist()
+    results = {}
+    for layout, frames in [
+        ("strings", (df_old, df_new)),
+        ("categorical", share_categories(df_old, df_new)),
+    ]:
+        cols = [col for col in CATEGORICAL_COLS if col in frames[1]]
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            compare_rows(*frames, pairs, columns)
+            times.append(time.perf_counter() - start)
+        results[layout] = {
+            "frame_bytes": sum(df.memory_usage(deep=True).sum() for df in frames),
+            "column_bytes": sum(
+                df[cols].memory_usage(deep=True).sum() for df in frames
+            ),
+            "compare_seconds": min(times),
+        }
+    return results
+
+
+def stage_runners(df_old, df_new):
+    # stage -> (setup, run): setup builds everything the stage needs so only
+    # run is measured
+    def diff_setup(df_old, df_new):
+        return lambda: ExcelDiff.from_frames(df_old, df_new)
+
+    def render_setup(df_old, df_new, sheet):
+        def setup():
+            report = ExcelReport(ExcelDiff.from_frames(df_old, df_new).compute())
+            report.open_workbook(io.BytesIO())
+            report.add_formats()
+            if sheet == "CHANGE_NOTES":
+                return report, report.add_notes_sheet(sheet)
+            return report, None
+
+        return setup
+
+    def run_changes_sheet(state):
+        report, worksheet = state
+        report.create_changes_sheet(worksheet)
+
+    def run_new_changes_sheet(state):
+        report, _ = state
+        report.create_new_changes_sheet()
+
+    runners = {
+        "create_changes_sheet": (
+            render_setup(df_old, df_new, "CHANGE_NOTES"),
+            run_changes_sheet,
+        ),
+        "create_new_changes_sheet": (
+            render_setup(df_old, df_new, "NEW_CHANGE_NOTES"),
+            run_new_changes_sheet,
+        ),
+    }
+    if df_old.columns.tolist() == df_new.columns.tolist():
+        runners["simple_diff"] = (
+            diff_setup(df_old, df_new),
+            lambda diff_class: diff_class.simple_diff(),
+        )
+    else:
+        runners["complex_diff"] = (
+            diff_setup(df_old, df_new),
+            lambda diff_class: diff_class.complex_diff(),
+        )
+    return runners
+
+
+def measure(setup, run, repeat):
+    # Best wall time of `repeat` untraced runs, peak memory from one traced run
+    times = []
+    for _ in range(repeat):
+        state = setup()
+        start = time.perf_counter()
+        run(state)
+        times.append(time.perf_counter() - start)
+    state = setup()
+    tracemalloc.start()
+    run(state)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"seconds": min(times), "peak_bytes": peak}
+
+
+def run_suite(sizes, repeat, extra_columns):
+    results = {}
+    for n_fields in sizes:
+        for case, extra in [("simple", 0), ("complex", extra_columns)]:
+            df_old, df_new = generate_pair(n_fields, extra_columns=extra)
+            for stage, (setup, run) in stage_runners(df_old, df_new).items():
+                key = f"{case}/{n_fields}/{stage}"
+                results[key] = measure(setup, run, repeat)
+                print(
+                    f"{key:48} {results[key]['seconds']:9.3f} s "
+                    f"{results[key]['peak_bytes'] / 2**20:9.1f} MiB",
+                    flush=True,
+                )
+    return results
+
+
+def compare(results, baseline, tolerance):
+    regressions = []
+    for key, current in results.items():
+        if key not in baseline:
+            continue
+        for metric in ["seconds", "peak_bytes"]:
+            ratio = current[metric] / max(baseline[key][metric], 1e-9)
+            if ratio > 1 + tolerance:
+                regressions.append(key)
+            print(f"{key:48} {metric:10} {ratio:6.2f}x baseline")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Time and memory-profile the diff stages on synthetic dictionaries"
+    )
+    parser.add_argument("--fields", type=int, nargs="+", default=[1000, 10000])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--extra-columns", type=int, default=5)
+    parser.add_argument("--baseline", help="compare against this baseline JSON")
+    parser.add_argument("--save-baseline", help="write the results to this JSON")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.2,
+        help="allowed slowdown/growth over the baseline before failing",
+    )
+    parser.add_argument(
+        "--records",
+        action="store_true",
+        help="compare change record memory with the old nested dict layout",
+    )
+    parser.add_argument(
+        "--dtypes",
+        action="store_true",
+        help="compare frame memory and compare time with and without categoricals",
+    )
+    args = parser.parse_args()
+    # Synthetic pairs have no auxiliary sheets to carry over
+    warnings.filterwarnings("ignore", message=".*auxiliary sheet")
+
+    if args.records:
+        for n_fields in args.fields:
+            record_size, legacy_size = bench_records(n_fields)
+            print(
+                f"{n_fields} fields: records {record_size / 2**20:.1f} MiB, "
+                f"nested dicts {legacy_size / 2**20:.1f} MiB "
+                f"({legacy_size / record_size:.1f}x)"
+            )
+        return 0
+
+    if args.dtypes:
+        for n_fields in args.fields:
+            results = bench_dtypes(n_fields, args.repeat)
+            strings, categorical = results["strings"], results["categorical"]
+            for layout, result in results.items():
+                print(
+                    f"{n_fields} fields, {layout:11}: frames "
+                    f"{result['frame_bytes'] / 2**20:7.1f} MiB, categorical columns "
+                    f"{result['column_bytes'] / 2**20:7.1f} MiB, compare "
+                    f"{result['compare_seconds']:.3f} s"
+                )
+            print(
+                f"{n_fields} fields: columns "
+                f"{strings['column_bytes'] / categorical['column_bytes']:.1f}x smaller, "
+                f"compare {strings['compare_seconds'] / categorical['compare_seconds']:.2f}x faster"
+            )
+        return 0
+
+    results = run_suite(args.fields, args.repeat, args.extra_columns)
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        if regressions:
+            print(f"Regressed: {', '.join(sorted(set(regressions)))}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,151 @@
+import hashlib
+import json
+import os
+import re
+import shutil
+import tempfile
+from pathlib import Path
+
+# Bump when the normalisation done by the reader changes, so older entries
+# are never returned for the new format
+CACHE_VERSION = 1
+DEFAULT_CACHE_DIR = Path(
+    os.environ.get(
+        "REDCAP_DIFF_CACHE_DIR",
+        Path.home() / ".cache" / "redcap-data-dictionary-diff",
+    )
+)
+DEFAULT_MAX_BYTES = 512 * 2**20
+# Entry directories are named by DictionaryCache.key, a sha256 hex digest
+KEY_RE = re.compile(r"[0-9a-f]{64}")
+
+
+def file_digest(path, chunk_size=2**20):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def inputs_identical(path_old, path_new):
+    # Sizes first, so differing files are usually told apart without reading
+    if os.path.getsize(path_old) != os.path.getsize(path_new):
+        return False
+    return file_digest(path_old) == file_digest(path_new)
+
+
+def write_frame(df, base):
+    # Parquet when pyarrow is installed and the columns are Arrow-typed; mixed
+    # object columns (e.g. numbers and "" after fillna) fall back to pickle
+    try:
+        df.to_parquet(f"{base}.parquet", index=False)
+        return f"{base.name}.parquet"
+    except Exception:
+        if os.path.exists(f"{base}.parquet"):
+            os.remove(f"{base}.parquet")
+    df.to_pickle(f"{base}.pkl")
+    return f"{base.name}.pkl"
+
+
+def read_frame(path):
+    import pandas as pd
+
+    if path.suffix == ".parquet":
+        return pd.read_parquet(path)
+    return pd.read_pickle(path)
+
+
+class DictionaryCache:
+    """On-disk cache of parsed data dictionaries, keyed by file content."""
+
+    def __init__(self, directory=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+
+    def key(self, path, aux_sheets=()):
+        # pandas is imported here rather than at module level so the CLI can
+        # clear the cache or compare file hashes without loading it
+        import pandas as pd
+
+        digest = hashlib.sha256(file_digest(path).encode())
+        digest.update(
+            json.dumps(
+                [CACHE_VERSION, pd.__version__, os.path.splitext(path)[1]]
+                + list(aux_sheets)
+            ).encode()
+        )
+        return digest.hexdigest()
+
+    def get(self, key):
+        entry = self.directory / key
+        try:
+            with open(entry / "sheets.json") as f:
+                files = json.load(f)
+            df = read_frame(entry / files["dictionary"])
+            aux = {name: read_frame(entry / fname) for name, fname in files["aux"]}
+        except (OSError, ValueError, KeyError):
+            return None
+        # Hits count as uses for LRU eviction
+        os.utime(entry)
+        return df, aux
+
+    def put(self, key, df, aux):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        # Entries are written to a temporary directory and renamed into place,
+        # so concurrent runs never see a partial entry
+        tmp = Path(tempfile.mkdtemp(dir=self.directory, prefix=".tmp-"))
+        try:
+            files = {
+                "dictionary": write_frame(df, tmp / "dictionary"),
+                "aux": [
+                    (name, write_frame(sheet, tmp / f"aux{ind}"))
+                    for ind, (name, sheet) in enumerate(aux.items())
+                ],
+            }
+            with open(tmp / "sheets.json", "w") as f:
+                json.dump(files, f)
+            os.replace(tmp, self.directory / key)
+        except OSError:
+            # Another run stored the same key first
+            shutil.rmtree(tmp, ignore_errors=True)
+        self.evict()
+
+    def read(self, path, aux_sheets, reader):
+        # reader(path, aux_sheets) -> (df, aux) is only called on a miss
+        key = self.key(path, aux_sheets)
+        cached = self.get(key)
+        if cached is not None:
+            return cached
+        df, aux = reader(path, aux_sheets)
+        self.put(key, df, aux)
+        return df, aux
+
+    def entries(self):
+        # Only directories this cache wrote; anything else that shares the
+        # directory is never touched
+        if not self.directory.is_dir():
+            return []
+        return [
+            entry
+            for entry in self.directory.iterdir()
+            if KEY_RE.fullmatch(entry.name)
+            and entry.is_dir()
+            and (entry / "sheets.json").is_file()
+        ]
+
+    def evict(self):
+        sizes = {
+            entry: sum(f.stat().st_size for f in entry.iterdir())
+            for entry in self.entries()
+        }
+        total = sum(sizes.values())
+        for entry in sorted(sizes, key=lambda entry: entry.stat().st_mtime):
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(entry, ignore_errors=True)
+            total -= sizes[entry]
+
+    def clear(self):
+        for entry in self.entries():
+            shutil.rmtree(entry, ignore_errors=True)
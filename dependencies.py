@@ -0,0 +1,56 @@
+import re
+from collections import namedtuple
+
+BRANCHING_COL = "Branching Logic (Show field only if...)"
+CALC_COL = "Choices, Calculations, OR Slider Labels"
+DEPENDENCY_COLS = (BRANCHING_COL, CALC_COL)
+
+# [field], [field(code)] for checkbox options and [field:modifier] piping.
+# The event of an [event][field] reference is indexed as well, which only
+# matters if an event shares a field's name.
+REFERENCE_RE = re.compile(r"\[([A-Za-z][\w]*)(?:\(([^()\[\]]*)\))?(?::[\w-]+)*\]")
+
+# A reference in column of field: reference is the matched text and code the
+# checkbox code of a [field(code)] reference, else None
+Dependency = namedtuple("Dependency", ["field", "column", "reference", "code"])
+
+
+class DependencyIndex:
+    """Referenced field -> the fields whose branching logic or calculation uses it."""
+
+    def __init__(self, df=None, field_col="Variable / Field Name", only=None):
+        # One regex pass over each logic cell; the work is linear in the
+        # total length of the branching logic and calculations. only limits
+        # the index to references to those fields.
+        self.dependents = {}
+        self.only = only
+        if df is None:
+            return
+        fields = df[field_col].tolist()
+        for column in DEPENDENCY_COLS:
+            if column not in df:
+                continue
+            for field, text in zip(fields, df[column].tolist()):
+                self.add(field, column, text)
+
+    def add(self, field, column, text):
+        # Indexes the references in the text of field's column; cells are
+        # added column by column to keep each field's dependents in order
+        if not isinstance(text, str) or "[" not in text:
+            return
+        seen = set()
+        for match in REFERENCE_RE.finditer(text):
+            if match.group(0) in seen:
+                continue
+            seen.add(match.group(0))
+            if self.only is not None and match.group(1) not in self.only:
+                continue
+            self.dependents.setdefault(match.group(1), []).append(
+                Dependency(field, column, match.group(0), match.group(2))
+            )
+
+    def __len__(self):
+        return len(self.dependents)
+
+    def __getitem__(self, field):
+        return self.dependents.get(field, [])
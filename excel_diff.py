@@ -0,0 +1,1477 @@
+import os
+import json
+import warnings
+import numpy as np
+import pandas as pd
+import xlsxwriter
+from collections import namedtuple
+from functools import lru_cache
+from types import MappingProxyType
+from datetime import datetime
+from dependencies import DependencyIndex
+from renames import detect_renames
+from rules import RuleSet
+from timing import StageTimer
+
+
+FIELD_NAME_COL = "Variable / Field Name"
+FIELD_TYPE_COL = "Field Type"
+CHOICES_COL = "Choices, Calculations, OR Slider Labels"
+CHOICE_FIELD_TYPES = {"radio", "dropdown", "checkbox"}
+REQUESTER_COL = "Who requested this data?"
+# Columns holding a handful of values repeated on every row; they are stored as
+# categoricals shared between the old and new frame (see share_categories)
+CATEGORICAL_COLS = [
+    "Form Name",
+    FIELD_TYPE_COL,
+    "Required Field?",
+    "Identifier?",
+    "Custom Alignment",
+    "Matrix Ranking?",
+    REQUESTER_COL,
+]
+
+# Header rows of the CHANGE_NOTES sections
+NOTES_RENAMED_HEADER = [
+    "Variable / Field Name",
+    "Old Field Name",
+    "Old Row Number",
+    "New Row Number",
+    "Similarity",
+]
+NOTES_DROPPED_HEADER = [
+    "Variable / Field Name",
+    "Old Row Number",
+    "Diff Row Number",
+    "Field Requester",
+]
+NOTES_CHANGE_HEADER = [
+    "Variable / Field Name",
+    "Old Row Number",
+    "New Row Number",
+    "Field Requester",
+]
+NOTES_DEPENDENT_HEADER = [
+    "Variable / Field Name",
+    "Change",
+    "Dependent Field",
+    "Column",
+    "Reference",
+]
+# Sheets of the DIFF workbook that can be selected; the auxiliary sheets of a
+# complex diff always follow CHANGE_NOTES and NEW_CHANGE_NOTES is simple-only
+REPORT_SHEETS = ("DIFF", "NEW", "OLD", "CHANGE_NOTES", "NEW_CHANGE_NOTES")
+
+# Distinct choice strings and choice pairs kept parsed. Bounded, as watch mode
+# diffs new versions in one process for as long as it runs.
+CHOICE_CACHE_SIZE = 2**14
+
+# Rules a complex diff applies when none are given: dropping a CCDE field is
+# dangerous and type or choice changes to CCDE fields are important
+DEFAULT_DANGEROUS_DROP_RULES = {REQUESTER_COL: ["CCDE"]}
+DEFAULT_IMPORTANT_CHANGE_RULES = {"fields": [FIELD_TYPE_COL, CHOICES_COL]}
+# Columns of the master dictionary a complex diff compares against
+REQUIRED_MASTER_COLS = 18
+
+# Molly's auxiliary sheets in the old workbook -> their name in the DIFF workbook
+AUX_SHEETS = {
+    "Missing or changed from CCDE": "Missing_different CCDE fields",
+    "Key": "Key",
+}
+
+# Aligned (new_pos, old_pos) row pairs, new-only positions in the new frame and
+# dropped positions in the old frame, all in original row order. renamed holds
+# the (new_pos, old_pos, score) pairs rename detection added to pairs.
+FieldMatch = namedtuple(
+    "FieldMatch",
+    ["pairs", "new_only", "dropped", "duplicates", "renamed"],
+    defaults=((),),
+)
+
+# Parsed (code, label) options of both sides of a choice change. added, removed
+# and relabeled are sets of codes; recoded maps old code -> new code for
+# options whose label moved to a different code. ChoiceDiffs are shared by
+# the diff_choices cache, so every part of them is immutable.
+ChoiceDiff = namedtuple(
+    "ChoiceDiff",
+    ["old_options", "new_options", "added", "removed", "relabeled", "recoded"],
+)
+
+
+class FieldIndex:
+    """Field name -> row position lookup for one data dictionary frame."""
+
+    def __init__(self, df):
+        self.positions = {}
+        self.duplicates = {}
+        for pos, field in enumerate(df[FIELD_NAME_COL].tolist()):
+            first = self.positions.setdefault(field, pos)
+            if first != pos:
+                self.duplicates.setdefault(field, [first]).append(pos)
+
+    def __contains__(self, field):
+        return field in self.positions
+
+    def __len__(self):
+        return len(self.positions)
+
+
+def read_dictionary(path, aux_sheets=()):
+    # The dictionary is the first sheet; the auxiliary sheets that exist are
+    # parsed from the same open workbook, so each file is only read once
+    ext = os.path.splitext(path)[1]
+    aux = {}
+    if ext == ".csv":
+        df = pd.read_csv(path)
+    elif ext == ".xlsx":
+        with pd.ExcelFile(path, engine="openpyxl") as workbook:
+            names = [name for name in aux_sheets if name in workbook.sheet_names]
+            sheets = workbook.parse(sheet_name=[0] + names)
+        df = sheets.pop(0)
+        aux = {name: sheet.fillna("") for name, sheet in sheets.items()}
+    else:
+        print(ext)
+        raise Exception("File must be .csv or .xlsx")
+    df = df.fillna("")
+    df = df.loc[:, ~df.columns.str.contains("^Unnamed")]
+    return df, aux
+
+
+def match_fields(df_old, df_new, old_index=None, new_index=None):
+    # Duplicate field names match against their first occurrence, as the
+    # per-row scan used to, but are returned so callers can report them.
+    old_index = old_index or FieldIndex(df_old)
+    new_index = new_index or FieldIndex(df_new)
+    pairs = []
+    new_only = []
+    for pos, field in enumerate(df_new[FIELD_NAME_COL].tolist()):
+        old_pos = old_index.positions.get(field)
+        if old_pos is None:
+            new_only.append(pos)
+        else:
+            pairs.append((pos, old_pos))
+    dropped = [
+        pos
+        for pos, field in enumerate(df_old[FIELD_NAME_COL].tolist())
+        if field not in new_index
+    ]
+    duplicates = {"old": old_index.duplicates, "new": new_index.duplicates}
+    return FieldMatch(pairs, new_only, dropped, duplicates)
+
+
+@lru_cache(maxsize=CHOICE_CACHE_SIZE)
+def parse_choices(choices):
+    # "1, Yes | 0, No" -> (("1", "Yes"), ("0", "No")). Options without a code
+    # (slider labels) use their label as the code.
+    options = []
+    for opt in str(choices).split("|"):
+        code, sep, label = opt.partition(",")
+        if not sep:
+            label = code
+        code, label = code.strip(), label.strip()
+        if code or label:
+            options.append((code, label))
+    return tuple(options)
+
+
+@lru_cache(maxsize=CHOICE_CACHE_SIZE)
+def diff_choices(old_choices, new_choices):
+    old_options = parse_choices(old_choices)
+    new_options = parse_choices(new_choices)
+    old_labels = dict(old_options)
+    new_labels = dict(new_options)
+    relabeled = frozenset(
+        code
+        for code in old_labels.keys() & new_labels.keys()
+        if old_labels[code] != new_labels[code]
+    )
+    added_by_label = {
+        label: code for code, label in new_options if code not in old_labels
+    }
+    recoded = {}
+    removed = set()
+    for code, label in old_options:
+        if code in new_labels:
+            continue
+        if label in added_by_label:
+            recoded[code] = added_by_label.pop(label)
+        else:
+            removed.add(code)
+    return ChoiceDiff(
+        old_options,
+        new_options,
+        frozenset(added_by_label.values()),
+        frozenset(removed),
+        relabeled,
+        MappingProxyType(recoded),
+    )
+
+
+def cell_value(value):
+    # Missing values (NaN, None, NaT) are written as blank cells
+    if isinstance(value, str) or not pd.isna(value):
+        return value
+    return ""
+
+
+def plain_value(value):
+    # JSON-ready cell value: numpy scalars become Python ones, anything else
+    # that is not a plain scalar (dates) is stringified
+    if isinstance(value, np.generic):
+        return value.item()
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    return str(value)
+
+
+def format_choice(code, label):
+    return label if code == label else f"{code}, {label}"
+
+
+def match_renames(match, renamed):
+    # Renamed fields are compared like any other pair instead of being
+    # reported as a drop plus an add
+    if not renamed:
+        return match._replace(renamed=())
+    new_pos = {new_ind for new_ind, _, _ in renamed}
+    old_pos = {old_ind for _, old_ind, _ in renamed}
+    return match._replace(
+        pairs=sorted(
+            match.pairs + [(new_ind, old_ind) for new_ind, old_ind, _ in renamed]
+        ),
+        new_only=[pos for pos in match.new_only if pos not in new_pos],
+        dropped=[pos for pos in match.dropped if pos not in old_pos],
+        renamed=tuple(renamed),
+    )
+
+
+def share_categories(df_old, df_new, columns=CATEGORICAL_COLS):
+    # Text columns with few distinct values become categoricals with one
+    # category set for both frames, so equal values have equal codes. Columns
+    # holding anything but strings (numbers, NaN) are left alone, as their
+    # categories would hide 1 != "1".
+    old_types, new_types = {}, {}
+    for col in columns:
+        frames = [df for df in (df_old, df_new) if col in df]
+        if not frames or any(
+            pd.api.types.infer_dtype(df[col], skipna=False) not in ("string", "empty")
+            for df in frames
+        ):
+            continue
+        categories = pd.unique(
+            np.concatenate(
+                [df[col].to_numpy(dtype=object) for df in frames]
+                + [np.array([""], dtype=object)]
+            )
+        )
+        if len(categories) * 2 > sum(len(df) for df in frames):
+            continue
+        dtype = pd.CategoricalDtype(categories)
+        if col in df_old:
+            old_types[col] = dtype
+        if col in df_new:
+            new_types[col] = dtype
+    return df_old.astype(old_types), df_new.astype(new_types)
+
+
+def object_columns(df):
+    # Back to plain values for renderers that add values outside the categories
+    return df.astype(
+        {
+            col: object
+            for col, dtype in df.dtypes.items()
+            if isinstance(dtype, pd.CategoricalDtype)
+        }
+    )
+
+
+def compare_rows(df_old, df_new, pairs, columns=None):
+    # One boolean change matrix (pair x column) over the aligned row pairs,
+    # using the same element-wise != the per-cell comparison did. Columns
+    # sharing a category set are compared by their codes.
+    columns = df_new.columns if columns is None else columns
+    new_pos = np.array([new_ind for new_ind, _ in pairs], dtype=int)
+    old_pos = np.array([old_ind for _, old_ind in pairs], dtype=int)
+    changed = np.empty((len(pairs), len(columns)), dtype=bool)
+    for ind, col in enumerate(columns):
+        new, old = df_new[col], df_old[col]
+        if (
+            isinstance(new.dtype, pd.CategoricalDtype)
+            and isinstance(old.dtype, pd.CategoricalDtype)
+            and new.dtype.categories.equals(old.dtype.categories)
+        ):
+            new_vals = new.cat.codes.to_numpy()
+            old_vals = old.cat.codes.to_numpy()
+        else:
+            new_vals = new.to_numpy(dtype=object)
+            old_vals = old.to_numpy(dtype=object)
+        changed[:, ind] = new_vals[new_pos] != old_vals[old_pos]
+    return changed
+
+
+def append_rows(df, df_other, positions):
+    # Gather the rows once and concatenate, rather than copying df per row
+    if not positions:
+        return df
+    return pd.concat([df, df_other.iloc[positions]], ignore_index=True, sort=False)
+
+
+# Change records keep row/column positions and read cell values from the
+# frames they came from, so a large diff does not hold copies of every value.
+# row_num/old_row_num/diff_row_num are 0-based sheet rows (header is row 0).
+class NewRow:
+    __slots__ = ("field", "row_num")
+
+    def __init__(self, field, row_num):
+        self.field = field
+        self.row_num = row_num
+
+
+class DroppedRow:
+    __slots__ = ("field", "old_row_num", "diff_row_num", "field_requester")
+
+    def __init__(self, field, old_row_num, diff_row_num, field_requester=None):
+        self.field = field
+        self.old_row_num = old_row_num
+        self.diff_row_num = diff_row_num
+        self.field_requester = field_requester
+
+
+class RenamedRow:
+    __slots__ = ("field", "old_field", "row_num", "old_row_num", "score")
+
+    def __init__(self, field, old_field, row_num, old_row_num, score):
+        self.field = field
+        self.old_field = old_field
+        self.row_num = row_num
+        self.old_row_num = old_row_num
+        self.score = score
+
+
+class ImpactedField:
+    # A dropped, renamed (field is the old name) or recoded field and the
+    # Dependency references to it left in the new dictionary
+    __slots__ = ("field", "change", "dependents")
+
+    def __init__(self, field, change, dependents):
+        self.field = field
+        self.change = change
+        self.dependents = dependents
+
+
+class FramePair:
+    __slots__ = ("df_old", "df_new", "columns", "old_col_nums")
+
+    def __init__(self, df_old, df_new, columns):
+        self.df_old = df_old
+        self.df_new = df_new
+        self.columns = columns
+        self.old_col_nums = {col: num for num, col in enumerate(df_old.columns)}
+
+
+class ChangedField:
+    __slots__ = (
+        "frames",
+        "field",
+        "row_num",
+        "old_row_num",
+        "field_requester",
+        "changed_cols",
+    )
+
+    def __init__(self, frames, field, row_num, old_row_num, field_requester=None):
+        self.frames = frames
+        self.field = field
+        self.row_num = row_num
+        self.old_row_num = old_row_num
+        self.field_requester = field_requester
+        self.changed_cols = []
+
+
+class ColumnChange:
+    # choices is a ChoiceDiff for choice lists, otherwise None; important is
+    # set when an important change rule matched the cell
+    __slots__ = ("change", "col_num", "choices", "important")
+
+    def __init__(self, change, col_num, choices=None, important=False):
+        self.change = change
+        self.col_num = col_num
+        self.choices = choices
+        self.important = important
+
+    @property
+    def col_name(self):
+        return self.change.frames.columns[self.col_num]
+
+    @property
+    def old_val(self):
+        frames = self.change.frames
+        return frames.df_old.iat[
+            self.change.old_row_num - 1, frames.old_col_nums[self.col_name]
+        ]
+
+    @property
+    def new_val(self):
+        return self.change.frames.df_new.iat[self.change.row_num - 1, self.col_num]
+
+
+# The match and the old-only column names (complex diffs) are kept so renderers
+# can rebuild the DIFF/NEW frames; everything else is the field-level outcome.
+# renamed_rows is None unless rename detection ran. important_columns are the
+# columns any important change rule names and rule_hits counts the dropped
+# rows or changed fields each rule matched. impacted_fields are the dropped,
+# renamed and recoded fields other fields' logic still references.
+class DiffResult(
+    namedtuple(
+        "DiffResult",
+        [
+            "df_old",
+            "df_new",
+            "match",
+            "complex",
+            "additional_cols",
+            "new_rows",
+            "dropped_rows",
+            "dangerous_dropped_rows",
+            "changes",
+            "dangerous_drop_rules",
+            "important_change_rules",
+            "aux_sheets",
+            "renamed_rows",
+            "important_columns",
+            "rule_hits",
+            "impacted_fields",
+        ],
+        defaults=(None, frozenset(), None, ()),
+    )
+):
+    """Outcome of comparing two data dictionaries, independent of any output."""
+
+    __slots__ = ()
+
+    @property
+    def important_changes(self):
+        # [(field, change_dict, important changed_cols)], as flagged by the
+        # important change rules
+        important = []
+        for field, change_dict in self.changes.items():
+            important_cols = [i for i in change_dict.changed_cols if i.important]
+            if important_cols:
+                important.append((field, change_dict, important_cols))
+        return important
+
+    @property
+    def needs_review(self):
+        return bool(self.dangerous_dropped_rows or self.important_changes)
+
+    def to_dict(self):
+        # Row numbers are the 1-based sheet rows CHANGE_NOTES shows
+        def dropped(row):
+            return {
+                "field": plain_value(row.field),
+                "old_row": row.old_row_num + 1,
+                "diff_row": row.diff_row_num + 1,
+                "requester": plain_value(row.field_requester),
+            }
+
+        renamed_rows = None
+        if self.renamed_rows is not None:
+            renamed_rows = [
+                {
+                    "field": plain_value(row.field),
+                    "old_field": plain_value(row.old_field),
+                    "row": row.row_num + 1,
+                    "old_row": row.old_row_num + 1,
+                    "score": row.score,
+                }
+                for row in self.renamed_rows
+            ]
+        return {
+            "complex": self.complex,
+            "needs_review": self.needs_review,
+            "new_rows": [
+                {"field": plain_value(row.field), "row": row.row_num + 1}
+                for row in self.new_rows
+            ],
+            "dropped_rows": [dropped(row) for row in self.dropped_rows],
+            "dangerous_dropped_rows": [
+                dropped(row) for row in self.dangerous_dropped_rows
+            ],
+            "renamed_rows": renamed_rows,
+            "rule_hits": self.rule_hits,
+            "impacted_fields": [
+                {
+                    "field": plain_value(impact.field),
+                    "change": impact.change,
+                    "dependents": [
+                        {
+                            "field": plain_value(dep.field),
+                            "column": dep.column,
+                            "reference": dep.reference,
+                        }
+                        for dep in impact.dependents
+                    ],
+                }
+                for impact in self.impacted_fields
+            ],
+            "changes": [
+                {
+                    "field": plain_value(field),
+                    "row": change.row_num + 1,
+                    "old_row": change.old_row_num + 1,
+                    "requester": plain_value(change.field_requester),
+                    "columns": [
+                        {
+                            "column": column.col_name,
+                            "old": plain_value(column.old_val),
+                            "new": plain_value(column.new_val),
+                        }
+                        for column in change.changed_cols
+                    ],
+                }
+                for field, change in self.changes.items()
+            ],
+        }
+
+    def new_frame(self):
+        # The NEW frame; complex diffs carry the old-only columns over to
+        # matched rows
+        if not self.complex:
+            return self.df_new
+        df_additional = self.df_old.iloc[[old_ind for _, old_ind in self.match.pairs]][
+            self.additional_cols
+        ]
+        df_additional.index = [ind for ind, _ in self.match.pairs]
+        return self.df_new.join(df_additional)
+
+    def diff_frames(self):
+        # The DIFF frame is the NEW frame followed by the dropped rows
+        df_new_final = self.new_frame()
+        df_diff = append_rows(df_new_final, self.df_old, self.match.dropped)
+        return df_diff, df_new_final
+
+
+class ExcelDiff:
+    def __init__(
+        self,
+        path_old,
+        path_new,
+        dangerous_drop_rules=None,
+        important_change_rules=None,
+        filename=None,
+        streaming=False,
+        cache=None,
+        timer=None,
+        detect_renames=False,
+        rules=None,
+        sheets=None,
+    ):
+        self.path_old = path_old
+        self.path_new = path_new
+        self.filename = filename
+        self.new_rows = None
+        self.df_new = None
+        self.df_old = None
+        self.dropped_rows = None
+        self.dangerous_dropped_rows = None
+        self.changes = None
+        self.result = None
+        self.dangerous_drop_rules = dangerous_drop_rules
+        self.important_change_rules = important_change_rules
+        # A RuleSet (e.g. RuleSet.load(config)) replaces the two dicts above
+        self.rules = rules
+        self.rule_masks = None
+        self.rule_hits = None
+        self.streaming = streaming
+        # Report sheets to write (see REPORT_SHEETS), default all of them
+        self.sheets = sheets
+        self.aux_sheets = {}
+        self.cache = cache
+        self.timer = timer or StageTimer()
+        self.detect_renames = detect_renames
+        # A FieldIndex of df_old kept by callers that diff one baseline many times
+        self.old_index = None
+
+    @classmethod
+    def from_frames(cls, df_old, df_new, aux_sheets=None, **kwargs):
+        diff_class = cls(None, None, **kwargs)
+        diff_class.set_frames(df_old, df_new)
+        diff_class.aux_sheets = dict(aux_sheets or {})
+        return diff_class
+
+    def set_frames(self, df_old, df_new):
+        self.df_old, self.df_new = share_categories(
+            df_old.reset_index(drop=True), df_new.reset_index(drop=True)
+        )
+
+    def load(self):
+        if self.df_old is not None and self.df_new is not None:
+            return
+        with self.timer.stage("read", file="old") as stage:
+            df_old, self.aux_sheets = self.read(self.path_old, AUX_SHEETS)
+            stage["rows"], stage["columns"] = df_old.shape
+        with self.timer.stage("read", file="new") as stage:
+            df_new, _ = self.read(self.path_new)
+            stage["rows"], stage["columns"] = df_new.shape
+        self.set_frames(df_old, df_new)
+
+    def read(self, path, aux_sheets=()):
+        # Sources other than files (redcap_api.RedcapProject) read themselves
+        if hasattr(path, "read_dictionary"):
+            return path.read_dictionary(aux_sheets)
+        if self.cache is None:
+            return read_dictionary(path, aux_sheets)
+        return self.cache.read(path, aux_sheets, read_dictionary)
+
+    def match_fields(self):
+        with self.timer.stage("match") as stage:
+            match = match_fields(self.df_old, self.df_new, old_index=self.old_index)
+            stage["old_rows"], stage["new_rows"] = len(self.df_old), len(self.df_new)
+            stage["pairs"] = len(match.pairs)
+        for side, path in [("old", self.path_old), ("new", self.path_new)]:
+            if match.duplicates[side]:
+                dupes = ", ".join(
+                    f"{field} (rows {', '.join(str(pos + 2) for pos in rows)})"
+                    for field, rows in match.duplicates[side].items()
+                )
+                warnings.warn(
+                    f"Duplicate field names in {path}, only the first occurrence is compared: {dupes}"
+                )
+        if self.detect_renames:
+            with self.timer.stage(
+                "renames", dropped=len(match.dropped), new=len(match.new_only)
+            ) as stage:
+                match = match_renames(
+                    match,
+                    detect_renames(
+                        self.df_old, self.df_new, match.dropped, match.new_only
+                    ),
+                )
+                stage["renamed"] = len(match.renamed)
+        return match
+
+    def renamed_rows(self, match):
+        if not self.detect_renames:
+            return None
+        return tuple(
+            RenamedRow(
+                self.df_new.at[ind, FIELD_NAME_COL],
+                self.df_old.at[old_ind, FIELD_NAME_COL],
+                ind + 1,
+                old_ind + 1,
+                score,
+            )
+            for ind, old_ind, score in match.renamed
+        )
+
+    def impacted_fields(self, renamed_rows):
+        # Fields of the new dictionary whose branching logic or calculation
+        # still references a dropped, renamed or recoded field
+        with self.timer.stage("dependencies") as stage:
+            index = DependencyIndex(self.df_new)
+            candidates = [(row.field, "Dropped") for row in self.dropped_rows]
+            candidates += [
+                (row.old_field, f"Renamed to {row.field}") for row in renamed_rows or ()
+            ]
+            for field, change in self.changes.items():
+                if any(
+                    col.choices is not None
+                    and (col.choices.removed or col.choices.recoded)
+                    for col in change.changed_cols
+                ):
+                    candidates.append((field, "Recoded"))
+            impacted = tuple(
+                ImpactedField(field, change, tuple(index[field]))
+                for field, change in candidates
+                if index[field]
+            )
+            stage["referenced"] = len(index)
+            stage["impacted"] = len(impacted)
+        return impacted
+
+    def collect_changes(self, match, requester_col=None):
+        with self.timer.stage("compare") as stage:
+            pairs = match.pairs
+            changes = self._collect_changes(pairs, requester_col)
+            stage["pairs"] = len(pairs)
+            stage["cells"] = len(pairs) * self.df_new.shape[1]
+            stage["changed_cells"] = sum(
+                len(change.changed_cols) for change in changes.values()
+            )
+        return changes
+
+    def _collect_changes(self, pairs, requester_col):
+        changes = {}
+        columns = self.df_new.columns.tolist()
+        fields = self.df_new[FIELD_NAME_COL].tolist()
+        changed = compare_rows(self.df_old, self.df_new, pairs, columns)
+        important = None
+        if self.rule_masks is not None and self.rule_masks.important_masks:
+            important, hits = self.rule_masks.important(
+                [old_ind for _, old_ind in pairs], columns, changed
+            )
+            self.rule_hits.update(hits)
+        if requester_col:
+            requesters = self.df_old[requester_col].tolist()
+        # Calculations and slider labels share the choices column, so only
+        # radio/dropdown/checkbox values are diffed option by option
+        type_ind = columns.index(FIELD_TYPE_COL) if FIELD_TYPE_COL in columns else None
+        frames = FramePair(self.df_old, self.df_new, columns)
+        if type_ind is not None:
+            old_type_ind = frames.old_col_nums[FIELD_TYPE_COL]
+        for pair_ind, col_ind in zip(*changed.nonzero()):
+            ind, old_ind = pairs[pair_ind]
+            field = fields[ind]
+            change = changes.get(field)
+            if change is None:
+                change = changes[field] = ChangedField(
+                    frames,
+                    field,
+                    ind + 1,
+                    old_ind + 1,
+                    requesters[old_ind] if requester_col else None,
+                )
+            choices = None
+            if columns[col_ind] == CHOICES_COL and (
+                type_ind is None
+                or self.df_new.iat[ind, type_ind] in CHOICE_FIELD_TYPES
+                or self.df_old.iat[old_ind, old_type_ind] in CHOICE_FIELD_TYPES
+            ):
+                choices = diff_choices(
+                    self.df_old.iat[old_ind, frames.old_col_nums[CHOICES_COL]],
+                    self.df_new.iat[ind, col_ind],
+                )
+            change.changed_cols.append(
+                ColumnChange(
+                    change,
+                    int(col_ind),
+                    choices,
+                    important is not None and bool(important[pair_ind, col_ind]),
+                )
+            )
+        return changes
+
+    def rule_set(self, requester_col=None):
+        if self.rules is not None:
+            return self.rules
+        return RuleSet.from_legacy(
+            self.dangerous_drop_rules, self.important_change_rules, requester_col
+        )
+
+    def rule_descriptions(self):
+        # What CHANGE_NOTES prints next to the dangerous/important sections
+        if self.rules is None:
+            return self.dangerous_drop_rules, self.important_change_rules
+        return self.rules.describe()
+
+    def evaluate_rules(self, match, requester_col=None):
+        # Every rule is evaluated once over all old rows; returns which of the
+        # dropped rows are dangerous
+        rules = self.rule_set(requester_col)
+        with self.timer.stage("rules", dropped=len(match.dropped)) as stage:
+            self.rule_masks = rules.evaluate(self.df_old)
+            dangerous = self.rule_masks.dangerous(match.dropped)
+            self.rule_hits = self.rule_masks.drop_hits(match.dropped)
+            stage["dangerous"] = int(dangerous.sum())
+            stage["hits"] = dict(self.rule_hits)
+        return dangerous
+
+    def compute(self):
+        self.load()
+        if self.df_old.columns.tolist() == self.df_new.columns.tolist():
+            self.result = self.simple_diff()
+        else:
+            self.result = self.complex_diff()
+        return self.result
+
+    def diff(self, verbose=False):
+        result = self.compute()
+        if not self.filename:
+            self.filename = (
+                f"DataDictionary_{datetime.now().strftime('%m-%d-%Y-%I%M%p')}"
+            )
+        # Save output and format
+        fname = "{}.xlsx".format(self.filename)
+        report = ExcelReport(
+            result, streaming=self.streaming, timer=self.timer, sheets=self.sheets
+        )
+        report.save(fname)
+        if verbose:
+            if report.diff_shape is not None:
+                # Not set when the DIFF sheet was left out
+                print(report.diff_shape)
+            print_summary(result)
+        return result
+
+    def simple_diff(self):
+        self.load()
+        self.dropped_rows = []
+        self.new_rows = []
+        self.dangerous_dropped_rows = []
+        match = self.match_fields()
+        # The simple diff only flags rows when given a RuleSet
+        if self.rules is not None:
+            dangerous = self.evaluate_rules(match)
+        else:
+            self.rule_masks = None
+            dangerous = np.zeros(len(match.dropped), dtype=bool)
+        self.changes = self.collect_changes(match)
+
+        for ind in match.new_only:
+            # The field is new
+            field = self.df_new.loc[ind, "Variable / Field Name"]
+            self.new_rows.append(NewRow(field, ind + 1))
+
+        # Dropped rows are appended below the new rows, in old row order
+        diff_row_start = self.df_new.shape[0] + 1
+        for offset, ind in enumerate(match.dropped):
+            field = self.df_old.loc[ind, "Variable / Field Name"]
+            dropped_row = DroppedRow(field, ind + 1, diff_row_start + offset)
+            self.dropped_rows.append(dropped_row)
+            if dangerous[offset]:
+                self.dangerous_dropped_rows.append(dropped_row)
+
+        renamed_rows = self.renamed_rows(match)
+        dangerous_drop_rules, important_change_rules = self.rule_descriptions()
+        return DiffResult(
+            df_old=self.df_old,
+            df_new=self.df_new,
+            match=match,
+            complex=False,
+            additional_cols=(),
+            new_rows=tuple(self.new_rows),
+            dropped_rows=tuple(self.dropped_rows),
+            dangerous_dropped_rows=tuple(self.dangerous_dropped_rows),
+            changes=MappingProxyType(self.changes),
+            dangerous_drop_rules=dangerous_drop_rules,
+            important_change_rules=important_change_rules,
+            aux_sheets=MappingProxyType(self.aux_sheets),
+            renamed_rows=renamed_rows,
+            important_columns=frozenset(self.rule_set().important_columns),
+            rule_hits=self.rule_hits,
+            impacted_fields=self.impacted_fields(renamed_rows),
+        )
+
+    def complex_diff(self, required_cols_in_master=REQUIRED_MASTER_COLS):
+        # self.df_old is Molly's spreadsheet (w/ 5 extra columns)
+        # df_new is the latest master data dictionary
+        self.load()
+
+        if not self.dangerous_drop_rules:
+            self.dangerous_drop_rules = DEFAULT_DANGEROUS_DROP_RULES
+        if not self.important_change_rules:
+            self.important_change_rules = DEFAULT_IMPORTANT_CHANGE_RULES
+
+        if self.df_new.shape[1] != required_cols_in_master:
+            err = f"The supplied new master data dictionary does not have the required number of columns. It has {self.df_new.shape[1]}, but needs {required_cols_in_master}."
+            raise ValueError(err)
+
+        missing = [name for name in AUX_SHEETS if name not in self.aux_sheets]
+        if missing:
+            warnings.warn(
+                f"{self.path_old or 'The old dictionary'} is missing the auxiliary sheet(s) {', '.join(missing)}; they are left out of the DIFF workbook"
+            )
+
+        self.dropped_rows = []
+        self.dangerous_dropped_rows = []
+        self.new_rows = []
+        match = self.match_fields()
+        # Molly's columns are added in at the matching new rows when rendering
+        additional_cols = [
+            col
+            for col in self.df_old.columns[required_cols_in_master:]
+            if col not in self.df_new.columns
+        ]
+
+        dangerous = self.evaluate_rules(match, REQUESTER_COL)
+        self.changes = self.collect_changes(match, requester_col=REQUESTER_COL)
+
+        for ind in match.new_only:
+            # The field is new
+            field = self.df_new.loc[ind, "Variable / Field Name"]
+            self.new_rows.append(NewRow(field, ind + 1))
+
+        # Dropped rows are appended below the new rows, in old row order
+        diff_row_start = self.df_new.shape[0] + 1
+        for offset, ind in enumerate(match.dropped):
+            field = self.df_old.loc[ind, "Variable / Field Name"]
+            dropped_row = DroppedRow(
+                field,
+                ind + 1,
+                diff_row_start + offset,
+                self.df_old.loc[ind, REQUESTER_COL],
+            )
+            self.dropped_rows.append(dropped_row)
+            if dangerous[offset]:
+                self.dangerous_dropped_rows.append(dropped_row)
+
+        renamed_rows = self.renamed_rows(match)
+        dangerous_drop_rules, important_change_rules = self.rule_descriptions()
+        return DiffResult(
+            df_old=self.df_old,
+            df_new=self.df_new,
+            match=match,
+            complex=True,
+            additional_cols=additional_cols,
+            new_rows=tuple(self.new_rows),
+            dropped_rows=tuple(self.dropped_rows),
+            dangerous_dropped_rows=tuple(self.dangerous_dropped_rows),
+            changes=MappingProxyType(self.changes),
+            dangerous_drop_rules=dangerous_drop_rules,
+            important_change_rules=important_change_rules,
+            aux_sheets=MappingProxyType(self.aux_sheets),
+            renamed_rows=renamed_rows,
+            important_columns=frozenset(self.rule_set().important_columns),
+            rule_hits=self.rule_hits,
+            impacted_fields=self.impacted_fields(renamed_rows),
+        )
+
+
+def change_notes_layout(
+    formats,
+    new_rows,
+    dropped_rows,
+    changes,
+    renamed_rows=None,
+    dangerous_drop_rules=None,
+    dangerous_dropped_rows=(),
+    important_change_rules=None,
+    important_changes=(),
+    impacted_fields=(),
+):
+    # CHANGE_NOTES as (row, col, values, format) runs of cells, generated in
+    # row order so constant_memory sheets can take them as they come; returns
+    # the row after the last section. changes yields (field, change) and
+    # important_changes (field, change, important columns); every record
+    # source is iterated once, so they can be cursors over an on-disk store.
+    header = formats["header"]
+    bold = formats["bold"]
+
+    def change_block(start, field, change, changed_cols, requester):
+        yield start + 1, 0, NOTES_CHANGE_HEADER, header
+        start += 2
+        yield (
+            start,
+            0,
+            [field, change.old_row_num + 1, change.row_num + 1, requester],
+            None,
+        )
+        start += 1
+        for col in changed_cols:
+            yield start, 0, ["Column Name"], header
+            yield start, 1, [col.col_name], None
+            yield start + 1, 0, ["Old Value"], header
+            if col.choices is not None:
+                old_formats, new_formats = choice_formats(formats, col.choices)
+                yield from option_cells(start + 1, col.choices.old_options, old_formats)
+                yield start + 2, 0, ["New Value"], header
+                yield from option_cells(start + 2, col.choices.new_options, new_formats)
+            else:
+                yield start + 1, 1, [col.old_val], None
+                yield start + 2, 0, ["New Value"], header
+                yield start + 2, 1, [col.new_val], None
+            start += 4
+        return start - 1
+
+    yield 0, 0, ["Change Notes"], None
+
+    # New Rows
+    start = 2
+    yield start, 0, ["New Rows:"], bold
+    yield start + 1, 0, ["Variable / Field Name", "Row Number"], header
+    start += 2
+    for row in new_rows:
+        yield start, 0, [row.field, row.row_num + 1], None
+        start += 1
+    start += 2
+
+    if renamed_rows is not None:
+        # Renamed Rows
+        yield start, 0, ["Renamed Rows:"], bold
+        yield start + 1, 0, NOTES_RENAMED_HEADER, header
+        start += 2
+        for row in renamed_rows:
+            yield (
+                start,
+                0,
+                [
+                    row.field,
+                    row.old_field,
+                    row.old_row_num + 1,
+                    row.row_num + 1,
+                    round(row.score, 3),
+                ],
+                None,
+            )
+            start += 1
+        start += 2
+
+    if dangerous_drop_rules:
+        # Dangerous Dropped Rows
+        yield (
+            start,
+            0,
+            ["Dangerous Dropped Rows:", json.dumps(dangerous_drop_rules)],
+            bold,
+        )
+        yield start + 1, 0, NOTES_DROPPED_HEADER, header
+        start += 2
+        for row in dangerous_dropped_rows:
+            yield (
+                start,
+                0,
+                [
+                    row.field,
+                    row.old_row_num + 1,
+                    row.diff_row_num + 1,
+                    row.field_requester,
+                ],
+                None,
+            )
+            start += 1
+        start += 2
+
+    if important_change_rules:
+        # Important Cell Changes
+        yield (
+            start,
+            0,
+            ["Important Changes:", json.dumps(important_change_rules)],
+            bold,
+        )
+        for field, change, important_cols in important_changes:
+            start = yield from change_block(
+                start, field, change, important_cols, change.field_requester
+            )
+    start += 2
+
+    # All Dropped Rows
+    yield start, 0, ["All Dropped Rows:"], bold
+    yield start + 1, 0, NOTES_DROPPED_HEADER, header
+    start += 2
+    for row in dropped_rows:
+        yield (
+            start,
+            0,
+            [
+                row.field,
+                row.old_row_num + 1,
+                row.diff_row_num + 1,
+                row.field_requester or None,
+            ],
+            None,
+        )
+        start += 1
+    start += 2
+
+    # All Cell Changes
+    yield start, 0, ["All Changes:", json.dumps(important_change_rules)], bold
+    for field, change in changes:
+        start = yield from change_block(
+            start, field, change, change.changed_cols, change.field_requester or None
+        )
+
+    if impacted_fields:
+        # Dependent Fields
+        start += 2
+        yield start, 0, ["Dependent Fields:"], bold
+        yield start + 1, 0, NOTES_DEPENDENT_HEADER, header
+        start += 2
+        for impact in impacted_fields:
+            for dep in impact.dependents:
+                yield (
+                    start,
+                    0,
+                    [
+                        impact.field,
+                        impact.change,
+                        dep.field,
+                        dep.column,
+                        dep.reference,
+                    ],
+                    None,
+                )
+                start += 1
+    return start
+
+
+def choice_formats(formats, choices):
+    # code -> format of the old and new options: removed/added, or kept
+    # their label but moved code/label
+    old_formats = {code: formats["dropped"] for code in choices.removed}
+    new_formats = {code: formats["new"] for code in choices.added}
+    for code in choices.relabeled.union(choices.recoded):
+        old_formats.setdefault(code, formats["changed"])
+    for code in choices.relabeled.union(choices.recoded.values()):
+        new_formats.setdefault(code, formats["changed"])
+    return old_formats, new_formats
+
+
+def option_cells(row, options, formats):
+    for opt_ind, (code, label) in enumerate(options):
+        yield row, 1 + opt_ind, [format_choice(code, label)], formats.get(code)
+
+
+def write_layout(worksheet, layout):
+    # Writes the cells of a layout generator; returns the generator's result
+    while True:
+        try:
+            row, col, values, fmt = next(layout)
+        except StopIteration as stop:
+            return stop.value
+        worksheet.write_row(row, col, values, fmt)
+
+
+class ExcelReport:
+    """Renders a DiffResult as the DIFF/NEW/OLD/CHANGE_NOTES workbook."""
+
+    def __init__(self, result, streaming=False, timer=None, sheets=None):
+        # sheets is a subset of REPORT_SHEETS to write, default all of them
+        if sheets is not None:
+            unknown = set(sheets).difference(REPORT_SHEETS)
+            if unknown:
+                raise ValueError(
+                    f"Unknown report sheets {', '.join(sorted(unknown))}, "
+                    f"use {', '.join(REPORT_SHEETS)}"
+                )
+            if not sheets:
+                raise ValueError("Select at least one report sheet")
+        self.result = result
+        self.sheets = frozenset(REPORT_SHEETS if sheets is None else sheets)
+        self.streaming = streaming
+        self.timer = timer or StageTimer()
+        self.writer = None
+        self.workbook = None
+        self.formats = {}
+        self.diff_shape = None
+
+    def open_workbook(self, fname):
+        if self.streaming:
+            # Rows are flushed to disk as soon as a later row is written, so
+            # every sheet has to be written top to bottom
+            self.writer = None
+            self.workbook = xlsxwriter.Workbook(
+                fname, {"constant_memory": True, "default_date_format": "MM/DD/YY"}
+            )
+            # Matches the header style to_excel uses, which pandas 3 dropped
+            self.formats["frame_header"] = None
+            if int(pd.__version__.split(".")[0]) < 3:
+                self.formats["frame_header"] = self.workbook.add_format(
+                    {"bold": True, "border": 1, "align": "center", "valign": "top"}
+                )
+            return
+        # TODO: Figure out how to handle date formatting/changes
+        self.writer = pd.ExcelWriter(
+            fname,
+            engine="xlsxwriter",
+            date_format="MM/DD/YY",
+            datetime_format="MM/DD/YY",
+        )
+        # get xlsxwriter objects
+        self.workbook = self.writer.book
+
+    def close_workbook(self):
+        if self.streaming:
+            self.workbook.close()
+        else:
+            self.writer.close()
+
+    def write_frame(self, df, sheet_name, row_formats=None, cell_formats=None):
+        # row_formats maps sheet row -> format and cell_formats maps sheet
+        # row -> {col: format}; sheet row 0 is the header
+        row_formats = row_formats or {}
+        cell_formats = cell_formats or {}
+        if not self.streaming:
+            df.to_excel(self.writer, sheet_name=sheet_name, index=False)
+            worksheet = self.writer.sheets[sheet_name]
+            for row, fmt in row_formats.items():
+                worksheet.set_row(row, 15, fmt)
+            for row, col_formats in cell_formats.items():
+                for col, fmt in col_formats.items():
+                    worksheet.write(row, col, cell_value(df.iat[row - 1, col]), fmt)
+            return worksheet
+
+        worksheet = self.workbook.add_worksheet(sheet_name)
+        worksheet.write_row(0, 0, df.columns.tolist(), self.formats["frame_header"])
+        # Rows are read straight from the frame's columns, so nothing the
+        # size of the sheet is built on top of the frame itself
+        for row, row_values in enumerate(df.itertuples(index=False, name=None), 1):
+            row_values = [cell_value(value) for value in row_values]
+            if row in row_formats:
+                worksheet.set_row(row, 15, row_formats[row])
+            col_formats = cell_formats.get(row)
+            if col_formats is None:
+                worksheet.write_row(row, 0, row_values)
+                continue
+            for col, value in enumerate(row_values):
+                worksheet.write(row, col, value, col_formats.get(col))
+        return worksheet
+
+    def add_notes_sheet(self, sheet_name):
+        if self.streaming:
+            return self.workbook.add_worksheet(sheet_name)
+        pd.DataFrame().to_excel(self.writer, sheet_name=sheet_name, index=False)
+        return self.writer.sheets[sheet_name]
+
+    def diff_sheet_formats(self):
+        # Changed cells are highlighted as important exactly when the rules
+        # flagged that cell, as in CHANGE_NOTES and --check
+        row_formats = {}
+        for row_data in self.result.new_rows:
+            row_formats[row_data.row_num] = self.formats["new"]
+        for row_data in self.result.dropped_rows:
+            row_formats[row_data.diff_row_num] = self.formats["dropped"]
+        cell_formats = {}
+        for field, row_dict in self.result.changes.items():
+            col_formats = cell_formats.setdefault(row_dict.row_num, {})
+            for column_dict in row_dict.changed_cols:
+                fmt = self.formats["changed"]
+                if column_dict.important:
+                    fmt = self.formats["important_changed"]
+                col_formats[column_dict.col_num] = fmt
+        return row_formats, cell_formats
+
+    def add_formats(self):
+        self.formats["new"] = self.workbook.add_format({"bg_color": "#90EE90"})
+        self.formats["dropped"] = self.workbook.add_format({"bg_color": "#ff9999"})
+        self.formats["changed"] = self.workbook.add_format({"bg_color": "#ffff66"})
+        self.formats["important_changed"] = self.workbook.add_format(
+            {"bg_color": "#ffB347"}
+        )
+        self.formats["header"] = self.workbook.add_format(
+            {"border": 1, "bg_color": "#DCDCDC"}
+        )
+        self.formats["bold"] = self.workbook.add_format({"bold": True})
+        self.formats["wrap"] = self.workbook.add_format({"text_wrap": True})
+
+    def save(self, fname):
+        self.open_workbook(fname)
+        self.add_formats()
+        if "DIFF" in self.sheets:
+            with self.timer.stage("render", sheet="DIFF") as stage:
+                df_diff, df_new_final = self.result.diff_frames()
+                self.diff_shape = df_diff.shape
+                row_formats, cell_formats = self.diff_sheet_formats()
+                worksheet1 = self.write_frame(
+                    df_diff, "DIFF", row_formats, cell_formats
+                )
+                worksheet1.set_column("A:Z", 30)
+                stage["rows"], stage["columns"] = df_diff.shape
+        elif "NEW" in self.sheets:
+            df_new_final = self.result.new_frame()
+        if "NEW" in self.sheets:
+            with self.timer.stage("render", sheet="NEW") as stage:
+                worksheet2 = self.write_frame(df_new_final, "NEW")
+                worksheet2.set_column("A:Z", 30)
+                stage["rows"], stage["columns"] = df_new_final.shape
+        if "OLD" in self.sheets:
+            with self.timer.stage("render", sheet="OLD") as stage:
+                worksheet3 = self.write_frame(self.result.df_old, "OLD")
+                worksheet3.set_column("A:Z", 30)
+                stage["rows"], stage["columns"] = self.result.df_old.shape
+
+        if "CHANGE_NOTES" in self.sheets:
+            with self.timer.stage("render", sheet="CHANGE_NOTES") as stage:
+                worksheet4 = self.add_notes_sheet("CHANGE_NOTES")
+                if self.result.complex:
+                    worksheet4.set_column("A:Z", 30)
+                stage["rows"] = self.create_changes_sheet(worksheet4)
+
+        if self.result.complex:
+            # Add Molly's additional sheets in
+            for name, sheet_name in AUX_SHEETS.items():
+                if name in self.result.aux_sheets:
+                    with self.timer.stage("render", sheet=sheet_name) as stage:
+                        sheet = self.result.aux_sheets[name]
+                        self.write_frame(sheet, sheet_name)
+                        stage["rows"], stage["columns"] = sheet.shape
+        elif "NEW_CHANGE_NOTES" in self.sheets:
+            with self.timer.stage("render", sheet="NEW_CHANGE_NOTES") as stage:
+                df_notes = self.create_new_changes_sheet()
+                stage["rows"], stage["columns"] = df_notes.shape
+
+        with self.timer.stage("save"):
+            self.close_workbook()
+
+    def create_changes_sheet(self, worksheet):
+        worksheet.set_column("A:A", 30)
+        worksheet.set_column("B:Z", 15)
+        return write_layout(worksheet, self.changes_layout())
+
+    def changes_layout(self):
+        result = self.result
+        return change_notes_layout(
+            self.formats,
+            result.new_rows,
+            result.dropped_rows,
+            result.changes.items(),
+            renamed_rows=result.renamed_rows,
+            dangerous_drop_rules=result.dangerous_drop_rules,
+            dangerous_dropped_rows=result.dangerous_dropped_rows,
+            important_change_rules=result.important_change_rules,
+            important_changes=result.important_changes,
+            impacted_fields=result.impacted_fields,
+        )
+
+    def create_new_changes_sheet(self):
+        # Renamed fields take their new name on the old side, so they merge
+        # as one row rather than a New and a Removed one
+        df_old = object_columns(self.result.df_old)
+        df_new = object_columns(self.result.df_new)
+        renamed_from = {}
+        if self.result.renamed_rows:
+            names = df_old[FIELD_NAME_COL].tolist()
+            for row in self.result.renamed_rows:
+                names[row.old_row_num - 1] = row.field
+                renamed_from[row.field] = row.old_field
+            df_old = df_old.assign(**{FIELD_NAME_COL: names})
+
+        df_merged = df_new.merge(
+            df_old,
+            left_on="Variable / Field Name",
+            right_on="Variable / Field Name",
+            suffixes=("_new", "_old"),
+            how="outer",
+            indicator=True,
+        )
+        df_merged.rename(
+            columns={"Variable / Field Name": "VARIABLE"},
+            inplace=True,
+        )
+        df_merged.rename(
+            columns={
+                col: f"MODIFIED_NEW_VALUE: {col.replace('_new','')}"
+                if col.endswith("_new")
+                else f"MODIFIED_OLD_VALUE: {col.replace('_old','')}"
+                for col in df_merged.columns.to_list()[1:-1]
+            },
+            inplace=True,
+        )
+        new_form = df_merged["MODIFIED_NEW_VALUE: Form Name"].fillna("")
+        old_form = df_merged["MODIFIED_OLD_VALUE: Form Name"].fillna("")
+        df_merged["merged_form"] = new_form.where(new_form != "", old_form)
+        df_merged["merged_form"] = df_merged["merged_form"].astype("category")
+        sort_order = pd.Series(
+            df_new["Form Name"].unique().tolist()
+            + df_old["Form Name"].unique().tolist()
+        ).unique()
+        df_merged["merged_form"] = df_merged["merged_form"].cat.set_categories(
+            sort_order
+        )
+        df_merged.index.name = "index"
+        df_merged.sort_values(["merged_form", "index"], inplace=True)
+
+        both = df_merged["_merge"] == "both"
+        any_modified = pd.Series(False, index=df_merged.index)
+        for col in self.result.df_new.columns.to_list()[1:]:
+            old = df_merged[f"MODIFIED_OLD_VALUE: {col}"]
+            new = df_merged[f"MODIFIED_NEW_VALUE: {col}"]
+            # Whitespace around "|" separators is not a modification
+            old_with_pipe_stripping = old.astype(str).str.replace(
+                r"\s*\|\s*", "|", regex=True
+            )
+            new_with_pipe_stripping = new.astype(str).str.replace(
+                r"\s*\|\s*", "|", regex=True
+            )
+            modified = both & ~(
+                (old == new)
+                | (old_with_pipe_stripping == new_with_pipe_stripping)
+                | (old.isnull() & new.isnull())
+            )
+            any_modified |= modified
+
+            df_merged[f"MODIFIED: {col}"] = modified.astype(int)
+            df_merged[f"MODIFIED_NEW_VALUE: {col}"] = new.where(modified, "N/A")
+            df_merged[f"MODIFIED_OLD_VALUE: {col}"] = old.where(modified, "N/A")
+
+        renamed = both & df_merged["VARIABLE"].isin(renamed_from)
+        df_merged["CHANGE_TYPE"] = np.select(
+            [
+                renamed,
+                both & any_modified,
+                df_merged["_merge"] == "left_only",
+                df_merged["_merge"] == "right_only",
+            ],
+            ["Renamed", "Modified", "New", "Removed"],
+            default="Unchanged",
+        )
+        df_merged["RENAMED_FROM"] = df_merged["VARIABLE"].map(renamed_from).fillna("")
+        df_merged = df_merged[df_merged.CHANGE_TYPE != "Unchanged"]
+
+        df_merged.reset_index(drop=True, inplace=True)
+
+        final_fields = ["VARIABLE", "merged_form", "CHANGE_TYPE"]
+        if self.result.renamed_rows is not None:
+            final_fields.append("RENAMED_FROM")
+        [
+            final_fields.extend(
+                [
+                    f"MODIFIED: {col}",
+                    f"MODIFIED_OLD_VALUE: {col}",
+                    f"MODIFIED_NEW_VALUE: {col}",
+                ]
+            )
+            for col in self.result.df_new.columns.to_list()[1:]
+        ]
+        df_merged = df_merged[final_fields]
+        df_merged.rename(columns={"merged_form": "FORM_NAME"}, inplace=True)
+        worksheet = self.write_frame(df_merged, "NEW_CHANGE_NOTES")
+        worksheet.set_column("A:BD", 30, self.formats["wrap"])
+        return df_merged
+
+
+def print_summary(result):
+    print("New Rows:")
+    for row in result.new_rows:
+        print(f"Field: {row.field}, Row Number: {row.row_num+1}")
+    if result.renamed_rows is not None:
+        print("Renamed Rows:")
+        for row in result.renamed_rows:
+            print(
+                f"Field: {row.field}, Old Field: {row.old_field}, Row Number: {row.row_num+1}, Old Row Number: {row.old_row_num+1}"
+            )
+    print("Dropped Rows:")
+    for row in result.dropped_rows:
+        if result.complex:
+            print(
+                f"Field: {row.field},\t\
+                    Diff Row Number: {row.diff_row_num+1},\t\
+                        Old Row Number: {row.old_row_num+1},\t\
+                            Dangerous? {row in result.dangerous_dropped_rows}"
+            )
+        else:
+            print(
+                f"Field: {row.field},\t\
+                    Diff Row Number: {row.diff_row_num+1},\t\
+                        Old Row Number: {row.old_row_num+1}"
+            )
+    print("Changed Rows:")
+    for row, data in result.changes.items():
+        print(
+            f"Name: {row}, Row Number: {data.row_num+1}, Old Row Number: {data.old_row_num+1}"
+        )
+        # print("Changed Columns:")
+        for column in data.changed_cols:
+            if result.complex:
+                print(
+                    f"Column: {column.col_name},\tImportant? {bool(column.important)}"
+                )
+            else:
+                print(f"Column: {column.col_name}")
+        print("*********")
+
+
+def print_counts(result):
+    print(f"New fields: {len(result.new_rows)}")
+    if result.renamed_rows is not None:
+        print(f"Renamed fields: {len(result.renamed_rows)}")
+    print(f"Dropped fields: {len(result.dropped_rows)}")
+    print(f"Dangerous dropped fields: {len(result.dangerous_dropped_rows)}")
+    print(f"Changed fields: {len(result.changes)}")
+    print(f"Important changes: {len(result.important_changes)}")
+    if result.impacted_fields:
+        print(
+            f"Dropped/renamed/recoded fields still referenced: {len(result.impacted_fields)}"
+        )
+    for name, hits in (result.rule_hits or {}).items():
+        print(f"Rule {name}: {hits}")
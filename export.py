@@ -0,0 +1,150 @@
+import csv
+import json
+import sys
+
+FORM_COL = "Form Name"
+# Bumped whenever a field is renamed, removed or changes meaning; new fields
+# may be added at the end without a bump
+SCHEMA_VERSION = 1
+# (name, type, description) of every change record, in output order
+RECORD_SCHEMA = [
+    ("change", "string", "new, dropped, renamed or changed"),
+    ("field", "string", "Variable / Field Name (the new name of a renamed field)"),
+    ("form", "string", "Form Name of the field (old row for dropped fields)"),
+    ("row", "int", "sheet row of the field in the new dictionary, null if dropped"),
+    ("old_row", "int", "sheet row of the field in the old dictionary, null if new"),
+    ("column", "string", "changed column, null unless change is changed"),
+    ("old_value", "string", "old cell value, or the old name of a renamed field"),
+    ("new_value", "string", "new cell value, or the new name of a renamed field"),
+    ("requester", "string", "Who requested this data? in the old row, if present"),
+    ("dangerous", "bool", "dropped field matched a dangerous drop rule"),
+    ("important", "bool", "changed cell matched an important change rule"),
+]
+RECORD_FIELDS = [name for name, _, _ in RECORD_SCHEMA]
+FORMATS = {"jsonl": ".jsonl", "csv": ".csv", "parquet": ".parquet"}
+
+
+def text_value(value):
+    # Cell values are written as text so every format has one type per field;
+    # blanks become null
+    if value is None or value == "":
+        return None
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+
+def change_records(result):
+    # One dict per field-level change of a DiffResult, produced lazily in
+    # CHANGE_NOTES order: new, dropped, renamed, then changed cells
+    def form(df, row_num):
+        if FORM_COL not in df:
+            return None
+        return text_value(df.iat[row_num - 1, df.columns.get_loc(FORM_COL)])
+
+    def record(change, field, **values):
+        rec = dict.fromkeys(RECORD_FIELDS)
+        rec.update(
+            change=change, field=text_value(field), dangerous=False, important=False
+        )
+        rec.update(values)
+        return rec
+
+    dangerous = {id(row) for row in result.dangerous_dropped_rows}
+    for row in result.new_rows:
+        yield record(
+            "new", row.field, form=form(result.df_new, row.row_num), row=row.row_num + 1
+        )
+    for row in result.dropped_rows:
+        yield record(
+            "dropped",
+            row.field,
+            form=form(result.df_old, row.old_row_num),
+            old_row=row.old_row_num + 1,
+            requester=text_value(row.field_requester),
+            dangerous=id(row) in dangerous,
+        )
+    for row in result.renamed_rows or ():
+        yield record(
+            "renamed",
+            row.field,
+            form=form(result.df_new, row.row_num),
+            row=row.row_num + 1,
+            old_row=row.old_row_num + 1,
+            old_value=text_value(row.old_field),
+            new_value=text_value(row.field),
+        )
+    for field, change in result.changes.items():
+        field_form = form(result.df_new, change.row_num)
+        for col in change.changed_cols:
+            yield record(
+                "changed",
+                field,
+                form=field_form,
+                row=change.row_num + 1,
+                old_row=change.old_row_num + 1,
+                column=col.col_name,
+                old_value=text_value(col.old_val),
+                new_value=text_value(col.new_val),
+                requester=text_value(change.field_requester),
+                important=bool(col.important),
+            )
+
+
+def write_jsonl(records, f):
+    count = 0
+    for count, rec in enumerate(records, 1):
+        f.write(json.dumps(rec) + "\n")
+    return count
+
+
+def write_csv(records, f):
+    writer = csv.DictWriter(f, fieldnames=RECORD_FIELDS)
+    writer.writeheader()
+    count = 0
+    for count, rec in enumerate(records, 1):
+        writer.writerow(rec)
+    return count
+
+
+def write_parquet(records, path, batch_rows=10000):
+    # Row groups of batch_rows records, so memory stays bounded by the batch
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ValueError("Parquet output needs pyarrow (pip install pyarrow)") from None
+    types = {"string": pa.string(), "int": pa.int64(), "bool": pa.bool_()}
+    schema = pa.schema(
+        [pa.field(name, types[kind]) for name, kind, _ in RECORD_SCHEMA],
+        metadata={"schema_version": str(SCHEMA_VERSION)},
+    )
+    count = 0
+    batch = []
+    with pq.ParquetWriter(path, schema) as writer:
+        for rec in records:
+            batch.append(rec)
+            if len(batch) >= batch_rows:
+                writer.write_table(pa.Table.from_pylist(batch, schema=schema))
+                count += len(batch)
+                batch = []
+        if batch or not count:
+            writer.write_table(pa.Table.from_pylist(batch, schema=schema))
+            count += len(batch)
+    return count
+
+
+def write_records(result, path, fmt):
+    # path "-" writes JSON Lines or CSV to stdout; returns the record count
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown format {fmt}, use one of {', '.join(FORMATS)}")
+    records = change_records(result)
+    if fmt == "parquet":
+        if path == "-":
+            raise ValueError("Parquet output needs a file name")
+        return write_parquet(records, path)
+    write = write_jsonl if fmt == "jsonl" else write_csv
+    if path == "-":
+        return write(records, sys.stdout)
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        return write(records, f)
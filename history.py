@@ -0,0 +1,301 @@
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import time
+from datetime import date, datetime
+from pathlib import Path
+
+import export
+from cache import file_digest
+
+DEFAULT_HISTORY_DB = os.environ.get("REDCAP_DIFF_HISTORY", "diff_history.sqlite")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS versions (
+    id INTEGER PRIMARY KEY,
+    digest TEXT NOT NULL UNIQUE,
+    name TEXT NOT NULL,
+    path TEXT,
+    released TEXT NOT NULL,
+    fields INTEGER
+);
+CREATE TABLE IF NOT EXISTS diffs (
+    id INTEGER PRIMARY KEY,
+    old_version INTEGER NOT NULL REFERENCES versions (id),
+    new_version INTEGER NOT NULL REFERENCES versions (id),
+    diffed_at TEXT NOT NULL,
+    UNIQUE (old_version, new_version)
+);
+CREATE TABLE IF NOT EXISTS changes (
+    diff_id INTEGER NOT NULL REFERENCES diffs (id),
+    field TEXT NOT NULL,
+    form TEXT,
+    change TEXT NOT NULL,
+    column_name TEXT,
+    old_value TEXT,
+    new_value TEXT,
+    requester TEXT,
+    dangerous INTEGER NOT NULL DEFAULT 0,
+    important INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS versions_released ON versions (released);
+CREATE INDEX IF NOT EXISTS diffs_new_version ON diffs (new_version);
+CREATE INDEX IF NOT EXISTS changes_field ON changes (field, column_name);
+CREATE INDEX IF NOT EXISTS changes_form ON changes (form);
+CREATE INDEX IF NOT EXISTS changes_column ON changes (column_name);
+CREATE INDEX IF NOT EXISTS changes_diff ON changes (diff_id);
+CREATE INDEX IF NOT EXISTS changes_dangerous ON changes (dangerous) WHERE dangerous;
+"""
+
+
+def change_records(result):
+    # The export records as rows of the changes table
+    for rec in export.change_records(result):
+        yield (
+            rec["field"],
+            rec["form"],
+            rec["change"],
+            rec["column"],
+            rec["old_value"],
+            rec["new_value"],
+            rec["requester"],
+            int(rec["dangerous"]),
+            int(rec["important"]),
+        )
+
+
+class HistoryStore:
+    """SQLite record of diffed dictionary versions and their field-level changes."""
+
+    def __init__(self, path=DEFAULT_HISTORY_DB):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def version_id(self, digest):
+        row = self.conn.execute(
+            "SELECT id FROM versions WHERE digest = ?", (digest,)
+        ).fetchone()
+        return row[0] if row else None
+
+    def has_diff(self, digest_old, digest_new):
+        return (
+            self.conn.execute(
+                "SELECT 1 FROM diffs d"
+                " JOIN versions o ON o.id = d.old_version"
+                " JOIN versions n ON n.id = d.new_version"
+                " WHERE o.digest = ? AND n.digest = ?",
+                (digest_old, digest_new),
+            ).fetchone()
+            is not None
+        )
+
+    def add_version(self, path, digest=None, released=None, fields=None):
+        # Versions are keyed by content, so the same file under another name
+        # or path is the version already stored
+        digest = digest or file_digest(path)
+        version_id = self.version_id(digest)
+        if version_id is not None:
+            return version_id
+        if released is None:
+            released = date.fromtimestamp(os.path.getmtime(path)).isoformat()
+        cursor = self.conn.execute(
+            "INSERT INTO versions (digest, name, path, released, fields)"
+            " VALUES (?, ?, ?, ?, ?)",
+            (digest, Path(path).name, str(path), released, fields),
+        )
+        return cursor.lastrowid
+
+    def record(self, result, path_old, path_new, released=None, old_released=None):
+        # Returns False without writing anything if this pair of contents was
+        # recorded before. released and old_released date the versions when
+        # they are first stored (default the file's mtime).
+        digest_old, digest_new = file_digest(path_old), file_digest(path_new)
+        if self.has_diff(digest_old, digest_new):
+            return False
+        with self.conn:
+            old_id = self.add_version(
+                path_old, digest_old, old_released, fields=len(result.df_old)
+            )
+            new_id = self.add_version(
+                path_new, digest_new, released, fields=len(result.df_new)
+            )
+            diff_id = self.conn.execute(
+                "INSERT INTO diffs (old_version, new_version, diffed_at) VALUES (?, ?, ?)",
+                (old_id, new_id, datetime.now().isoformat(timespec="seconds")),
+            ).lastrowid
+            self.conn.executemany(
+                "INSERT INTO changes VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                ((diff_id,) + record for record in change_records(result)),
+            )
+        return True
+
+    def query(self, sql, params=()):
+        cursor = self.conn.execute(sql, params)
+        columns = [col[0] for col in cursor.description]
+        return [dict(zip(columns, row)) for row in cursor]
+
+    def timeline(self, field, column=None, limit=None):
+        # Every recorded change to field (or to one of its columns), oldest
+        # release first
+        sql = (
+            "SELECT v.released, o.name AS old_version, v.name AS new_version,"
+            " c.change, c.column_name, c.old_value, c.new_value, c.requester,"
+            " c.dangerous, c.important"
+            " FROM changes c JOIN diffs d ON d.id = c.diff_id"
+            " JOIN versions v ON v.id = d.new_version"
+            " JOIN versions o ON o.id = d.old_version"
+            " WHERE c.field = ?"
+        )
+        params = [field]
+        if column is not None:
+            sql += " AND c.column_name = ?"
+            params.append(column)
+        sql += " ORDER BY v.released DESC, v.id DESC"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+        return self.query(sql, params)[::-1]
+
+    def dangerous_drops(self, since=None, form=None):
+        sql = (
+            "SELECT v.released, o.name AS old_version, v.name AS new_version,"
+            " c.field, c.form, c.requester"
+            " FROM changes c JOIN diffs d ON d.id = c.diff_id"
+            " JOIN versions v ON v.id = d.new_version"
+            " JOIN versions o ON o.id = d.old_version"
+            " WHERE c.dangerous"
+        )
+        params = []
+        if since is not None:
+            sql += " AND v.released >= ?"
+            params.append(since)
+        if form is not None:
+            sql += " AND c.form = ?"
+            params.append(form)
+        return self.query(sql + " ORDER BY v.released, v.id, c.field", params)
+
+    def versions(self):
+        return self.query(
+            "SELECT v.released, v.name, v.fields, v.digest,"
+            " (SELECT COUNT(*) FROM diffs d WHERE d.new_version = v.id) AS diffs"
+            " FROM versions v ORDER BY v.released, v.id"
+        )
+
+
+def cell_text(value):
+    # Zero counts and flags are shown; only missing values are blank
+    return "" if value is None else str(value)
+
+
+def print_rows(rows, as_json=False):
+    if as_json:
+        print(json.dumps(rows, indent=2))
+        return
+    if not rows:
+        print("No records")
+        return
+    columns = list(rows[0])
+    widths = {
+        col: min(40, max(len(col), *(len(cell_text(row[col])) for row in rows)))
+        for col in columns
+    }
+    print("  ".join(col.ljust(widths[col]) for col in columns))
+    for row in rows:
+        print(
+            "  ".join(
+                cell_text(row[col])[: widths[col]].ljust(widths[col]) for col in columns
+            )
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Record diffed dictionary versions and query their change history"
+    )
+    parser.add_argument(
+        "--db",
+        default=DEFAULT_HISTORY_DB,
+        help="history database (default $REDCAP_DIFF_HISTORY or diff_history.sqlite)",
+    )
+    output = argparse.ArgumentParser(add_help=False)
+    output.add_argument("--json", action="store_true", help="print the results as JSON")
+    commands = parser.add_subparsers(dest="command", required=True)
+    ingest = commands.add_parser(
+        "ingest", help="diff and record old -> new (-> newer ...)"
+    )
+    ingest.add_argument("versions", nargs="+", help="dictionaries in release order")
+    ingest.add_argument(
+        "--released",
+        nargs="+",
+        help="release date (YYYY-MM-DD) of each version; default the file mtimes",
+    )
+    ingest.add_argument("--detect-renames", action="store_true")
+    timeline = commands.add_parser(
+        "timeline", parents=[output], help="changes to one field"
+    )
+    timeline.add_argument("field")
+    timeline.add_argument("--column", help="only changes to this column")
+    timeline.add_argument("--last", type=int, help="only the most recent N changes")
+    dangerous = commands.add_parser(
+        "dangerous", parents=[output], help="dangerous drops"
+    )
+    dangerous.add_argument("--since", help="released on or after YYYY-MM-DD")
+    dangerous.add_argument("--form")
+    commands.add_parser("versions", parents=[output], help="recorded versions")
+    args = parser.parse_args()
+
+    with HistoryStore(args.db) as store:
+        if args.command == "ingest":
+            if len(args.versions) < 2:
+                parser.error("ingest needs at least two versions")
+            pairs = list(zip(args.versions, args.versions[1:]))
+            released = args.released or [None] * len(args.versions)
+            if len(released) != len(args.versions):
+                parser.error(
+                    f"give {len(args.versions)} --released dates, one per version"
+                )
+            for (path_old, path_new), old_day, day in zip(
+                pairs, released, released[1:]
+            ):
+                if store.has_diff(file_digest(path_old), file_digest(path_new)):
+                    print(f"{path_old} -> {path_new}: already recorded")
+                    continue
+                from excel_diff import ExcelDiff
+
+                result = ExcelDiff(
+                    path_old, path_new, detect_renames=args.detect_renames
+                ).compute()
+                store.record(result, path_old, path_new, day, old_day)
+                print(
+                    f"{path_old} -> {path_new}: recorded {len(result.new_rows)} new, "
+                    f"{len(result.dropped_rows)} dropped, {len(result.changes)} changed"
+                )
+            return 0
+        started = time.perf_counter()
+        if args.command == "timeline":
+            rows = store.timeline(args.field, args.column, args.last)
+        elif args.command == "dangerous":
+            rows = store.dangerous_drops(args.since, args.form)
+        else:
+            rows = store.versions()
+        elapsed = time.perf_counter() - started
+    print_rows(rows, args.json)
+    if not args.json:
+        print(f"{len(rows)} rows in {elapsed * 1000:.1f} ms")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
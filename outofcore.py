@@ -0,0 +1,709 @@
+import csv
+import os
+import re
+import sqlite3
+import tempfile
+import warnings
+from collections import namedtuple
+from itertools import compress, groupby, islice
+
+import pandas as pd
+import xlsxwriter
+
+from dependencies import DEPENDENCY_COLS, DependencyIndex
+from excel_diff import (
+    AUX_SHEETS,
+    CHOICE_FIELD_TYPES,
+    CHOICES_COL,
+    DEFAULT_DANGEROUS_DROP_RULES,
+    DEFAULT_IMPORTANT_CHANGE_RULES,
+    FIELD_TYPE_COL,
+    REQUESTER_COL,
+    REQUIRED_MASTER_COLS,
+    DroppedRow,
+    ImpactedField,
+    NewRow,
+    change_notes_layout,
+    diff_choices,
+    write_layout,
+)
+from rules import RuleSet
+from timing import StageTimer
+
+FIELD_NAME_COL = "Variable / Field Name"
+FORM_COL = "Form Name"
+DEFAULT_CHUNK_ROWS = 10000
+# Whitespace around "|" separators is not a modification in NEW_CHANGE_NOTES
+PIPE_RE = re.compile(r"\s*\|\s*")
+
+# Changes read back from the store, with the attributes change_notes_layout
+# reads from ChangedField and ColumnChange
+StoredChange = namedtuple(
+    "StoredChange", ["row_num", "old_row_num", "field_requester", "changed_cols"]
+)
+StoredColumn = namedtuple(
+    "StoredColumn", ["col_name", "old_val", "new_val", "choices", "important"]
+)
+
+
+def sheet_value(value):
+    # Cells are stored as read: text for CSV, numbers stay numbers for .xlsx;
+    # dates are stored as ISO text since SQLite has no date type
+    if value is None:
+        return ""
+    if isinstance(value, (str, int, float)):
+        return value
+    return value.isoformat() if hasattr(value, "isoformat") else str(value)
+
+
+def iter_dictionary(path):
+    # (columns, rows) of the first sheet without loading it: unnamed columns
+    # and blank rows are dropped, as read_dictionary does
+    ext = os.path.splitext(str(path))[1]
+    if ext == ".csv":
+        f = open(path, newline="", encoding="utf-8-sig")
+        rows = csv.reader(f)
+    elif ext == ".xlsx":
+        from openpyxl import load_workbook
+
+        workbook = load_workbook(path, read_only=True, data_only=True)
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+    else:
+        raise Exception("File must be .csv or .xlsx")
+    header = [sheet_value(col) for col in next(rows, ())]
+    keep = [
+        ind
+        for ind, col in enumerate(header)
+        if col != "" and not str(col).startswith("Unnamed")
+    ]
+
+    def values():
+        try:
+            for row in rows:
+                row = [sheet_value(value) for value in row]
+                row += [""] * (len(header) - len(row))
+                values = tuple(row[ind] for ind in keep)
+                if any(str(value).strip() for value in values):
+                    yield values
+        finally:
+            if ext == ".csv":
+                f.close()
+            else:
+                workbook.close()
+
+    return [str(header[ind]) for ind in keep], values()
+
+
+class OutOfCoreDiff:
+    """Diffs two dictionaries through an on-disk SQLite store instead of pandas.
+
+    Both inputs are streamed into the store chunk_rows rows at a time, matched
+    with a sort-merge join over the field name index and the workbook is
+    streamed back out of the store, so memory does not grow with the inputs.
+    The workbook has the sheets and CHANGE_NOTES layout of ExcelDiff's, with
+    the rules evaluated over the old rows chunk_rows at a time.
+    """
+
+    def __init__(
+        self,
+        path_old,
+        path_new,
+        chunk_rows=DEFAULT_CHUNK_ROWS,
+        db_path=None,
+        timer=None,
+        rules=None,
+    ):
+        if not isinstance(chunk_rows, int) or chunk_rows < 1:
+            raise ValueError(
+                f"chunk_rows must be a positive integer, not {chunk_rows!r}"
+            )
+        self.path_old = path_old
+        self.path_new = path_new
+        self.chunk_rows = chunk_rows
+        self.db_path = db_path
+        self.timer = timer or StageTimer()
+        # A RuleSet; complex diffs default to the rules ExcelDiff applies
+        self.rules = rules
+        self.conn = None
+        self.columns = {}
+        self.complex = False
+        self.counts = None
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def open(self):
+        self.owns_db = self.db_path is None
+        if self.owns_db:
+            fd, self.db_path = tempfile.mkstemp(suffix=".sqlite")
+            os.close(fd)
+        self.conn = sqlite3.connect(self.db_path)
+        # The store is scratch space, so durability is traded for speed
+        self.conn.execute("PRAGMA journal_mode = OFF")
+        self.conn.execute("PRAGMA synchronous = OFF")
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+        if self.owns_db and os.path.exists(self.db_path):
+            os.remove(self.db_path)
+
+    def chunks(self, rows):
+        while True:
+            chunk = list(islice(rows, self.chunk_rows))
+            if not chunk:
+                return
+            yield chunk
+
+    def load_table(self, name, path):
+        # {name}_rows(pos, field, c0..cN) indexed on (field, pos)
+        with self.timer.stage("load", file=name) as stage:
+            columns, rows = iter_dictionary(path)
+            self.columns[name] = columns
+            name_ind = columns.index(FIELD_NAME_COL) if FIELD_NAME_COL in columns else 0
+            cols = ", ".join(f"c{ind}" for ind in range(len(columns)))
+            marks = ", ".join("?" * (len(columns) + 2))
+            self.conn.execute(f"DROP TABLE IF EXISTS {name}_rows")
+            self.conn.execute(
+                f"CREATE TABLE {name}_rows (pos INTEGER PRIMARY KEY, field TEXT, {cols})"
+            )
+            pos = 0
+            for chunk in self.chunks(rows):
+                self.conn.executemany(
+                    f"INSERT INTO {name}_rows VALUES ({marks})",
+                    (
+                        (pos + ind, str(values[name_ind]), *values)
+                        for ind, values in enumerate(chunk)
+                    ),
+                )
+                pos += len(chunk)
+            self.conn.execute(f"CREATE INDEX {name}_field ON {name}_rows (field, pos)")
+            self.conn.commit()
+            stage["rows"], stage["columns"] = pos, len(columns)
+
+    def merge(self):
+        # Both tables are walked in (field, pos) order. Duplicate names match
+        # their first old occurrence and old rows are dropped when no new row
+        # has their name, as match_fields does.
+        old_cols, new_cols = self.columns["old"], self.columns["new"]
+        old_pos = {col: ind for ind, col in enumerate(old_cols)}
+        col_pairs = [(ind, old_pos.get(col)) for ind, col in enumerate(new_cols)]
+        for table in ["pairs", "new_only", "dropped", "changes"]:
+            self.conn.execute(f"DROP TABLE IF EXISTS {table}")
+        self.conn.execute(
+            "CREATE TABLE pairs (new_pos INTEGER PRIMARY KEY, old_pos INTEGER)"
+        )
+        self.conn.execute("CREATE TABLE new_only (pos INTEGER PRIMARY KEY)")
+        # dangerous and important are set by evaluate_rules
+        self.conn.execute(
+            "CREATE TABLE dropped (pos INTEGER PRIMARY KEY, dangerous INTEGER)"
+        )
+        self.conn.execute(
+            "CREATE TABLE changes (new_pos INTEGER, col INTEGER, old_val, new_val,"
+            " important INTEGER, PRIMARY KEY (new_pos, col))"
+        )
+        buffers = {"pairs": [], "new_only": [], "dropped": [], "changes": []}
+
+        def emit(table, row):
+            buffer = buffers[table]
+            buffer.append(row)
+            if len(buffer) >= self.chunk_rows:
+                flush(table)
+
+        def flush(table):
+            if buffers[table]:
+                marks = ", ".join("?" * len(buffers[table][0]))
+                self.conn.executemany(
+                    f"INSERT INTO {table} VALUES ({marks})", buffers[table]
+                )
+                buffers[table] = []
+
+        def groups(name, ncols):
+            cols = ", ".join(f"c{ind}" for ind in range(ncols))
+            cursor = self.conn.cursor().execute(
+                f"SELECT field, pos, {cols} FROM {name}_rows ORDER BY field, pos"
+            )
+            return groupby(cursor, key=lambda row: row[0])
+
+        with self.timer.stage("merge") as stage:
+            old_groups = groups("old", len(old_cols))
+            new_groups = groups("new", len(new_cols))
+            old_group = next(old_groups, None)
+            new_group = next(new_groups, None)
+            # Field names are TEXT in the BINARY collation, which orders like
+            # Python str comparison
+            while old_group is not None or new_group is not None:
+                if new_group is None or (
+                    old_group is not None and old_group[0] < new_group[0]
+                ):
+                    for row in old_group[1]:
+                        emit("dropped", (row[1], 0))
+                    old_group = next(old_groups, None)
+                elif old_group is None or new_group[0] < old_group[0]:
+                    for row in new_group[1]:
+                        emit("new_only", (row[1],))
+                    new_group = next(new_groups, None)
+                else:
+                    old_first = next(old_group[1])
+                    old_row = old_first[2:]
+                    for row in new_group[1]:
+                        new_pos, new_vals = row[1], row[2:]
+                        emit("pairs", (new_pos, old_first[1]))
+                        for ind, old_ind in col_pairs:
+                            old_val = old_row[old_ind] if old_ind is not None else ""
+                            if new_vals[ind] != old_val:
+                                emit(
+                                    "changes", (new_pos, ind, old_val, new_vals[ind], 0)
+                                )
+                    old_group = next(old_groups, None)
+                    new_group = next(new_groups, None)
+            for table in buffers:
+                flush(table)
+            self.conn.commit()
+            self.counts = {
+                "new": self.count("SELECT COUNT(*) FROM new_only"),
+                "dropped": self.count("SELECT COUNT(*) FROM dropped"),
+                "changed": self.count("SELECT COUNT(DISTINCT new_pos) FROM changes"),
+                "pairs": self.count("SELECT COUNT(*) FROM pairs"),
+                "changed_cells": self.count("SELECT COUNT(*) FROM changes"),
+            }
+            stage.update(self.counts)
+        return self.counts
+
+    def count(self, query):
+        return self.conn.execute(query).fetchone()[0]
+
+    def compute(self):
+        self.load_table("old", self.path_old)
+        self.load_table("new", self.path_new)
+        # Different columns mean Molly's spreadsheet against the master
+        # dictionary, as in ExcelDiff.compute
+        self.complex = self.columns["old"] != self.columns["new"]
+        if self.complex and len(self.columns["new"]) != REQUIRED_MASTER_COLS:
+            raise ValueError(
+                f"The supplied new master data dictionary does not have the required number of columns. It has {len(self.columns['new'])}, but needs {REQUIRED_MASTER_COLS}."
+            )
+        self.merge()
+        self.evaluate_rules()
+        return self.counts
+
+    def rule_set(self):
+        if self.rules is not None:
+            return self.rules
+        if not self.complex:
+            return None
+        return RuleSet.from_legacy(
+            DEFAULT_DANGEROUS_DROP_RULES, DEFAULT_IMPORTANT_CHANGE_RULES, REQUESTER_COL
+        )
+
+    def rule_descriptions(self):
+        if self.rules is not None:
+            return self.rules.describe()
+        if self.complex:
+            return DEFAULT_DANGEROUS_DROP_RULES, DEFAULT_IMPORTANT_CHANGE_RULES
+        return None, None
+
+    def old_frames(self, query):
+        # (key, frame) chunks of a query selecting a key and every old column
+        old_cols = self.columns["old"]
+        for chunk in self.chunks(self.select(query)):
+            yield (
+                [row[0] for row in chunk],
+                pd.DataFrame([row[1:] for row in chunk], columns=old_cols),
+            )
+
+    def evaluate_rules(self):
+        # Flags dangerous dropped rows and important changed cells; the rules
+        # see the old rows one chunk at a time
+        rules = self.rule_set()
+        if rules is None:
+            self.counts.update(dangerous=0, important=0)
+            return
+        old_cols = ", ".join(f"o.c{ind}" for ind in range(len(self.columns["old"])))
+        new_cols = self.columns["new"]
+        with self.timer.stage("rules") as stage:
+            dangerous = []
+            for positions, df in self.old_frames(
+                f"SELECT d.pos, {old_cols} FROM dropped d"
+                " JOIN old_rows o ON o.pos = d.pos ORDER BY d.pos"
+            ):
+                flags = rules.evaluate(df).dangerous(range(len(df)))
+                dangerous += [(pos,) for pos in compress(positions, flags)]
+            important = []
+            rule_cols = [
+                [ind for ind, col in enumerate(new_cols) if col in rule.columns]
+                for rule in rules.important_changes
+            ]
+            if rules.important_changes:
+                for positions, df in self.old_frames(
+                    f"SELECT p.new_pos, {old_cols} FROM pairs p"
+                    " JOIN old_rows o ON o.pos = p.old_pos"
+                    " WHERE p.new_pos IN (SELECT new_pos FROM changes)"
+                    " ORDER BY p.new_pos"
+                ):
+                    masks = rules.evaluate(df).important_masks
+                    for mask, cols in zip(masks, rule_cols):
+                        important += [
+                            (pos, col)
+                            for pos in compress(positions, mask)
+                            for col in cols
+                        ]
+            self.conn.executemany(
+                "UPDATE dropped SET dangerous = 1 WHERE pos = ?", dangerous
+            )
+            # Unchanged cells of a matching row have no changes row to update
+            self.conn.executemany(
+                "UPDATE changes SET important = 1 WHERE new_pos = ? AND col = ?",
+                important,
+            )
+            self.conn.commit()
+            self.counts["dangerous"] = len(dangerous)
+            self.counts["important"] = self.count(
+                "SELECT COUNT(DISTINCT new_pos) FROM changes WHERE important"
+            )
+            stage["dangerous"] = self.counts["dangerous"]
+            stage["important"] = self.counts["important"]
+
+    def diff(self, fname):
+        counts = self.compute()
+        self.save(fname)
+        return counts
+
+    def select(self, query):
+        # Rows are fetched chunk_rows at a time
+        cursor = self.conn.cursor()
+        cursor.arraysize = self.chunk_rows
+        cursor.execute(query)
+        while True:
+            rows = cursor.fetchmany()
+            if not rows:
+                return
+            yield from rows
+
+    def save(self, fname):
+        # The sheets of ExcelDiff's workbook, written in constant memory
+        workbook = xlsxwriter.Workbook(
+            fname, {"constant_memory": True, "default_date_format": "MM/DD/YY"}
+        )
+        self.formats = {
+            "new": workbook.add_format({"bg_color": "#90EE90"}),
+            "dropped": workbook.add_format({"bg_color": "#ff9999"}),
+            "changed": workbook.add_format({"bg_color": "#ffff66"}),
+            "important_changed": workbook.add_format({"bg_color": "#ffB347"}),
+            "header": workbook.add_format({"border": 1, "bg_color": "#DCDCDC"}),
+            "bold": workbook.add_format({"bold": True}),
+            "wrap": workbook.add_format({"text_wrap": True}),
+        }
+        with self.timer.stage("render", sheet="DIFF") as stage:
+            stage["rows"] = self.write_diff_sheet(workbook.add_worksheet("DIFF"))
+        with self.timer.stage("render", sheet="NEW") as stage:
+            stage["rows"] = self.write_diff_sheet(
+                workbook.add_worksheet("NEW"), diff=False
+            )
+        with self.timer.stage("render", sheet="OLD") as stage:
+            stage["rows"] = self.write_table_sheet(workbook.add_worksheet("OLD"), "old")
+        impacted = self.impacted_fields()
+        with self.timer.stage("render", sheet="CHANGE_NOTES") as stage:
+            stage["rows"] = self.write_notes_sheet(
+                workbook.add_worksheet("CHANGE_NOTES"), impacted
+            )
+        if self.complex:
+            self.write_aux_sheets(workbook)
+        elif FORM_COL in self.columns["new"]:
+            with self.timer.stage("render", sheet="NEW_CHANGE_NOTES") as stage:
+                stage["rows"] = self.write_new_notes_sheet(
+                    workbook.add_worksheet("NEW_CHANGE_NOTES")
+                )
+        with self.timer.stage("save"):
+            workbook.close()
+
+    def write_table_sheet(self, worksheet, name):
+        columns = self.columns[name]
+        worksheet.set_column("A:Z", 30)
+        worksheet.write_row(0, 0, columns)
+        cols = ", ".join(f"c{ind}" for ind in range(len(columns)))
+        row = 0
+        for row, values in enumerate(
+            self.select(f"SELECT {cols} FROM {name}_rows ORDER BY pos"), 1
+        ):
+            worksheet.write_row(row, 0, values)
+        return row
+
+    def write_diff_sheet(self, worksheet, diff=True):
+        # The new rows with the old-only columns of their match (the NEW
+        # sheet), then for DIFF the dropped rows, with new rows and changed
+        # cells highlighted
+        new_cols, old_cols = self.columns["new"], self.columns["old"]
+        old_pos = {col: ind for ind, col in enumerate(old_cols)}
+        additional = []
+        if self.complex:
+            additional = [
+                col for col in old_cols[REQUIRED_MASTER_COLS:] if col not in new_cols
+            ]
+        columns = new_cols + additional
+        worksheet.set_column("A:Z", 30)
+        worksheet.write_row(0, 0, columns)
+        new_select = ", ".join(f"n.c{ind}" for ind in range(len(new_cols)))
+        extra_select = "".join(f", o.c{old_pos[col]}" for col in additional)
+        rows = self.select(
+            f"SELECT n.pos, p.old_pos IS NULL, {new_select}{extra_select}"
+            " FROM new_rows n LEFT JOIN pairs p ON p.new_pos = n.pos"
+            " LEFT JOIN old_rows o ON o.pos = p.old_pos ORDER BY n.pos"
+        )
+        changes = groupby(
+            self.select(
+                "SELECT new_pos, col, important FROM changes ORDER BY new_pos, col"
+            ),
+            key=lambda change: change[0],
+        )
+        change = next(changes, None) if diff else None
+        row = 0
+        for row, (pos, new_only, *values) in enumerate(rows, 1):
+            values = ["" if value is None else value for value in values]
+            if new_only and diff:
+                worksheet.set_row(row, 15, self.formats["new"])
+            changed = {}
+            if change is not None and change[0] == pos:
+                changed = {
+                    col: self.formats["important_changed" if important else "changed"]
+                    for _, col, important in change[1]
+                }
+                change = next(changes, None)
+            if not changed:
+                worksheet.write_row(row, 0, values)
+                continue
+            for col, value in enumerate(values):
+                worksheet.write(row, col, value, changed.get(col))
+        if not diff:
+            return row
+        dropped_select = ", ".join(
+            f"o.c{old_pos[col]}" if col in old_pos else "''" for col in columns
+        )
+        for row, values in enumerate(
+            self.select(
+                f"SELECT {dropped_select} FROM dropped d JOIN old_rows o ON o.pos = d.pos"
+                " ORDER BY d.pos"
+            ),
+            row + 1,
+        ):
+            worksheet.set_row(row, 15, self.formats["dropped"])
+            worksheet.write_row(row, 0, values)
+        return row
+
+    def requester_select(self):
+        # Requesters only come from Molly's column of a complex diff
+        old_cols = self.columns["old"]
+        if self.complex and REQUESTER_COL in old_cols:
+            return f"o.c{old_cols.index(REQUESTER_COL)}"
+        return "NULL"
+
+    def new_rows(self):
+        for field, pos in self.select(
+            "SELECT n.field, n.pos FROM new_only x JOIN new_rows n ON n.pos = x.pos"
+            " ORDER BY x.pos"
+        ):
+            yield NewRow(field, pos + 1)
+
+    def dropped_rows(self, dangerous_only=False):
+        # Dropped rows are below the new rows in the DIFF sheet, in old row order
+        diff_row_start = self.count("SELECT COUNT(*) FROM new_rows") + 1
+        rows = self.select(
+            f"SELECT o.field, o.pos, {self.requester_select()}, d.dangerous"
+            " FROM dropped d JOIN old_rows o ON o.pos = d.pos ORDER BY d.pos"
+        )
+        for offset, (field, pos, requester, dangerous) in enumerate(rows):
+            if dangerous or not dangerous_only:
+                yield DroppedRow(field, pos + 1, diff_row_start + offset, requester)
+
+    def changes(self, where=None):
+        # (field, StoredChange) in new row order, holding the changed cells
+        # the where clause selects; choice lists are diffed option by option
+        # for the field types ExcelDiff does
+        new_cols, old_cols = self.columns["new"], self.columns["old"]
+        new_type = old_type = "NULL"
+        if FIELD_TYPE_COL in new_cols:
+            new_type = f"n.c{new_cols.index(FIELD_TYPE_COL)}"
+        if FIELD_TYPE_COL in old_cols:
+            old_type = f"o.c{old_cols.index(FIELD_TYPE_COL)}"
+        rows = self.select(
+            f"SELECT n.field, c.new_pos, p.old_pos, {self.requester_select()},"
+            f" {new_type}, {old_type}, c.col, c.old_val, c.new_val, c.important"
+            " FROM changes c JOIN pairs p ON p.new_pos = c.new_pos"
+            " JOIN new_rows n ON n.pos = c.new_pos JOIN old_rows o ON o.pos = p.old_pos"
+            f"{f' WHERE {where}' if where else ''} ORDER BY c.new_pos, c.col"
+        )
+        for (field, pos, old_pos, requester, new_type, old_type), cells in groupby(
+            rows, key=lambda row: row[:6]
+        ):
+            change = StoredChange(pos + 1, old_pos + 1, requester, [])
+            for *_, col, old_val, new_val, important in cells:
+                choices = None
+                if new_cols[col] == CHOICES_COL and (
+                    FIELD_TYPE_COL not in new_cols
+                    or new_type in CHOICE_FIELD_TYPES
+                    or old_type in CHOICE_FIELD_TYPES
+                ):
+                    choices = diff_choices(old_val, new_val)
+                change.changed_cols.append(
+                    StoredColumn(
+                        new_cols[col], old_val, new_val, choices, bool(important)
+                    )
+                )
+            yield field, change
+
+    def impacted_fields(self):
+        # The dropped and recoded fields still referenced by the branching
+        # logic or calculations of the new dictionary; the index only keeps
+        # references to those fields
+        with self.timer.stage("dependencies") as stage:
+            candidates = [(row.field, "Dropped") for row in self.dropped_rows()]
+            new_cols = self.columns["new"]
+            if CHOICES_COL in new_cols:
+                for field, change in self.changes(
+                    f"c.col = {new_cols.index(CHOICES_COL)}"
+                ):
+                    if any(
+                        col.choices is not None
+                        and (col.choices.removed or col.choices.recoded)
+                        for col in change.changed_cols
+                    ):
+                        candidates.append((field, "Recoded"))
+            index = DependencyIndex(only={field for field, _ in candidates})
+            for column in DEPENDENCY_COLS:
+                if column in new_cols:
+                    for field, text in self.select(
+                        f"SELECT field, c{new_cols.index(column)} FROM new_rows"
+                        " ORDER BY pos"
+                    ):
+                        index.add(field, column, text)
+            impacted = tuple(
+                ImpactedField(field, change, tuple(index[field]))
+                for field, change in candidates
+                if index[field]
+            )
+            stage["referenced"] = len(index)
+            stage["impacted"] = len(impacted)
+        return impacted
+
+    def write_notes_sheet(self, worksheet, impacted_fields):
+        # CHANGE_NOTES in ExcelReport's layout, fed from the store
+        worksheet.set_column("A:A", 30)
+        worksheet.set_column("B:Z", 15)
+        dangerous_drop_rules, important_change_rules = self.rule_descriptions()
+        return write_layout(
+            worksheet,
+            change_notes_layout(
+                self.formats,
+                self.new_rows(),
+                self.dropped_rows(),
+                self.changes(),
+                dangerous_drop_rules=dangerous_drop_rules,
+                dangerous_dropped_rows=self.dropped_rows(dangerous_only=True),
+                important_change_rules=important_change_rules,
+                important_changes=(
+                    (field, change, change.changed_cols)
+                    for field, change in self.changes("c.important")
+                ),
+                impacted_fields=impacted_fields,
+            ),
+        )
+
+    def write_aux_sheets(self, workbook):
+        # Molly's auxiliary sheets, copied row by row from the old workbook
+        found = []
+        if os.path.splitext(str(self.path_old))[1] == ".xlsx":
+            from openpyxl import load_workbook
+
+            source = load_workbook(self.path_old, read_only=True, data_only=True)
+            try:
+                for name, sheet_name in AUX_SHEETS.items():
+                    if name not in source.sheetnames:
+                        continue
+                    found.append(name)
+                    with self.timer.stage("render", sheet=sheet_name) as stage:
+                        worksheet = workbook.add_worksheet(sheet_name)
+                        row = 0
+                        for row, values in enumerate(
+                            source[name].iter_rows(values_only=True)
+                        ):
+                            worksheet.write_row(
+                                row, 0, [sheet_value(value) for value in values]
+                            )
+                        stage["rows"] = row
+            finally:
+                source.close()
+        missing = [name for name in AUX_SHEETS if name not in found]
+        if missing:
+            warnings.warn(
+                f"{self.path_old} is missing the auxiliary sheet(s) {', '.join(missing)}; they are left out of the DIFF workbook"
+            )
+
+    def write_new_notes_sheet(self, worksheet):
+        # NEW_CHANGE_NOTES of a simple diff: the modified, new and removed
+        # fields ordered by form (in order of appearance, new dictionary
+        # first) and then by name
+        columns = self.columns["new"]
+        form_ind = columns.index(FORM_COL)
+        ranks = {}
+        for name in ["new", "old"]:
+            for (form,) in self.select(
+                f"SELECT c{form_ind} FROM {name}_rows ORDER BY pos"
+            ):
+                ranks.setdefault(form, len(ranks))
+        self.conn.execute("DROP TABLE IF EXISTS form_ranks")
+        self.conn.execute("CREATE TABLE form_ranks (form PRIMARY KEY, rank INTEGER)")
+        self.conn.executemany("INSERT INTO form_ranks VALUES (?, ?)", ranks.items())
+
+        new_select = ", ".join(f"n.c{ind}" for ind in range(len(columns)))
+        old_select = ", ".join(f"o.c{ind}" for ind in range(len(columns)))
+        nulls = ", ".join(["NULL"] * len(columns))
+        rows = self.select(
+            "SELECT t.* FROM ("
+            f" SELECT n.field AS field, CASE WHEN n.c{form_ind} = ''"
+            f" THEN o.c{form_ind} ELSE n.c{form_ind} END AS form,"
+            " 'Modified', n.pos AS new_pos, o.pos AS old_pos,"
+            f" {new_select}, {old_select}"
+            " FROM pairs p JOIN new_rows n ON n.pos = p.new_pos"
+            " JOIN old_rows o ON o.pos = p.old_pos"
+            " WHERE p.new_pos IN (SELECT new_pos FROM changes)"
+            f" UNION ALL SELECT n.field, n.c{form_ind}, 'New', n.pos, NULL,"
+            f" {new_select}, {nulls}"
+            " FROM new_only x JOIN new_rows n ON n.pos = x.pos"
+            f" UNION ALL SELECT o.field, o.c{form_ind}, 'Removed', NULL, o.pos,"
+            f" {nulls}, {old_select}"
+            " FROM dropped d JOIN old_rows o ON o.pos = d.pos"
+            ") t JOIN form_ranks r ON r.form IS t.form"
+            " ORDER BY r.rank, t.field, t.new_pos, t.old_pos"
+        )
+        header = ["VARIABLE", "FORM_NAME", "CHANGE_TYPE"]
+        for col in columns[1:]:
+            header += [
+                f"MODIFIED: {col}",
+                f"MODIFIED_OLD_VALUE: {col}",
+                f"MODIFIED_NEW_VALUE: {col}",
+            ]
+        worksheet.write_row(0, 0, header)
+        row = 0
+        for field, form, change_type, _, _, *values in rows:
+            new_vals, old_vals = values[: len(columns)], values[len(columns) :]
+            cells = []
+            any_modified = False
+            for ind in range(1, len(columns)):
+                old, new = old_vals[ind], new_vals[ind]
+                modified = change_type == "Modified" and not (
+                    old == new
+                    or PIPE_RE.sub("|", str(old)) == PIPE_RE.sub("|", str(new))
+                )
+                any_modified |= modified
+                cells += [int(modified), old, new] if modified else [0, "N/A", "N/A"]
+            if change_type == "Modified" and not any_modified:
+                continue
+            row += 1
+            worksheet.write_row(row, 0, [field, form, change_type, *cells])
+        worksheet.set_column("A:BD", 30, self.formats["wrap"])
+        return row
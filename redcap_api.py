@@ -0,0 +1,224 @@
+import argparse
+import http.client
+import io
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from urllib.parse import urlencode, urlsplit
+
+import pandas as pd
+
+# content=metadata keys -> data dictionary columns, in data dictionary order
+API_COLUMNS = {
+    "field_name": "Variable / Field Name",
+    "form_name": "Form Name",
+    "section_header": "Section Header",
+    "field_type": "Field Type",
+    "field_label": "Field Label",
+    "select_choices_or_calculations": "Choices, Calculations, OR Slider Labels",
+    "field_note": "Field Note",
+    "text_validation_type_or_show_slider_number": "Text Validation Type OR Show Slider Number",
+    "text_validation_min": "Text Validation Min",
+    "text_validation_max": "Text Validation Max",
+    "identifier": "Identifier?",
+    "branching_logic": "Branching Logic (Show field only if...)",
+    "required_field": "Required Field?",
+    "custom_alignment": "Custom Alignment",
+    "question_number": "Question Number (surveys only)",
+    "matrix_group_name": "Matrix Group Name",
+    "matrix_ranking": "Matrix Ranking?",
+    "field_annotation": "Field Annotation",
+}
+# Throttling and server errors are retried, anything else fails at once
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class RedcapError(Exception):
+    pass
+
+
+def metadata_frame(records):
+    # Goes through CSV text so values get the same types read_dictionary
+    # gives a downloaded data dictionary (numbers in validation min/max etc.)
+    df = pd.DataFrame(records).reindex(columns=list(API_COLUMNS)).fillna("")
+    buffer = io.StringIO()
+    df.rename(columns=API_COLUMNS).to_csv(buffer, index=False)
+    buffer.seek(0)
+    return pd.read_csv(buffer).fillna("")
+
+
+class RedcapClient:
+    """Fetches project metadata from REDCap APIs over pooled keep-alive connections."""
+
+    def __init__(self, timeout=30, retries=3, backoff=0.5, max_workers=8):
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.max_workers = max_workers
+        # One connection per (scheme, host) per thread, reused across requests
+        self.local = threading.local()
+
+    def connection(self, scheme, netloc):
+        pool = self.local.__dict__.setdefault("connections", {})
+        conn = pool.get((scheme, netloc))
+        if conn is None:
+            conn_class = (
+                http.client.HTTPSConnection
+                if scheme == "https"
+                else http.client.HTTPConnection
+            )
+            conn = pool[(scheme, netloc)] = conn_class(netloc, timeout=self.timeout)
+        return conn
+
+    def discard(self, scheme, netloc):
+        conn = self.local.__dict__.get("connections", {}).pop((scheme, netloc), None)
+        if conn is not None:
+            conn.close()
+
+    def post(self, url, fields):
+        parts = urlsplit(url)
+        path = parts.path or "/"
+        body = urlencode(fields).encode()
+        headers = {
+            "Content-Type": "application/x-www-form-urlencoded",
+            "Accept": "application/json",
+        }
+        for attempt in range(self.retries + 1):
+            if attempt:
+                time.sleep(self.backoff * 2 ** (attempt - 1))
+            conn = self.connection(parts.scheme, parts.netloc)
+            try:
+                conn.request("POST", path, body, headers)
+                response = conn.getresponse()
+                data = response.read()
+            except (OSError, http.client.HTTPException) as err:
+                # The connection may be half closed; retry on a fresh one
+                self.discard(parts.scheme, parts.netloc)
+                error = RedcapError(f"{url}: {err}")
+                continue
+            if response.status == 200:
+                return data
+            error = RedcapError(
+                f"{url} returned HTTP {response.status}: {data[:200].decode(errors='replace')}"
+            )
+            if response.status not in RETRY_STATUSES:
+                raise error
+        raise error
+
+    def fetch_metadata(self, url, token):
+        data = self.post(
+            url,
+            {
+                "token": token,
+                "content": "metadata",
+                "format": "json",
+                "returnFormat": "json",
+            },
+        )
+        try:
+            records = json.loads(data)
+        except ValueError:
+            raise RedcapError(f"{url} did not return JSON metadata") from None
+        if isinstance(records, dict):
+            raise RedcapError(f"{url}: {records.get('error', records)}")
+        return metadata_frame(records)
+
+    def fetch_all(self, projects):
+        # {name: frame} for many projects, at most max_workers requests in
+        # flight. Every project is attempted before failures are raised.
+        frames = {}
+        errors = {}
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            futures = {
+                project.name: pool.submit(
+                    self.fetch_metadata, project.url, project.token
+                )
+                for project in projects
+            }
+            for name, future in futures.items():
+                try:
+                    frames[name] = future.result()
+                except RedcapError as err:
+                    errors[name] = err
+        if errors:
+            raise RedcapError(
+                "; ".join(f"{name}: {err}" for name, err in errors.items())
+            )
+        return frames
+
+
+DEFAULT_CLIENT = RedcapClient()
+
+
+class RedcapProject:
+    """A project's data dictionary read from the REDCap API instead of a file."""
+
+    def __init__(self, name, url, token, client=None):
+        self.name = name
+        self.url = url
+        self.token = token
+        self.client = client or DEFAULT_CLIENT
+
+    def __str__(self):
+        return f"redcap:{self.name}"
+
+    def read_dictionary(self, aux_sheets=()):
+        # Same (df, aux) shape as excel_diff.read_dictionary; the API has no
+        # auxiliary sheets
+        return self.client.fetch_metadata(self.url, self.token), {}
+
+
+def load_projects(path, client=None):
+    # {"name": {"url": ..., "token": ...}}; "token_env" names an environment
+    # variable holding the token instead, so tokens can stay out of the file
+    # Raises ValueError for a malformed file
+    with open(path) as f:
+        config = json.load(f)
+    if not isinstance(config, dict):
+        raise ValueError(f"{path} must hold an object of projects")
+    projects = {}
+    for name, settings in config.items():
+        if not isinstance(settings, dict) or "url" not in settings:
+            raise ValueError(f"REDCap project {name} in {path} needs a url")
+        token = settings.get("token")
+        if token is None:
+            token = os.environ.get(settings.get("token_env", ""))
+        if not token:
+            raise ValueError(f"No API token for REDCap project {name} in {path}")
+        projects[name] = RedcapProject(name, settings["url"], token, client)
+    return projects
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Download the data dictionaries of REDCap projects as CSV"
+    )
+    parser.add_argument("projects", help="projects JSON file")
+    parser.add_argument("--out", default=".", help="folder to write {project}.csv to")
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--timeout", type=float, default=30)
+    parser.add_argument("--retries", type=int, default=3)
+    args = parser.parse_args()
+    client = RedcapClient(args.timeout, args.retries, max_workers=args.workers)
+    try:
+        projects = load_projects(args.projects, client)
+    except (OSError, ValueError) as err:
+        parser.error(f"could not load projects from {args.projects}: {err}")
+    try:
+        frames = client.fetch_all(projects.values())
+    except RedcapError as err:
+        print(err, file=sys.stderr)
+        return 1
+    Path(args.out).mkdir(parents=True, exist_ok=True)
+    for name, df in frames.items():
+        df.to_csv(Path(args.out) / f"{name}.csv", index=False)
+        print(f"{name}: {len(df)} fields")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,121 @@
+import argparse
+import json
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+import pandas as pd
+
+from redcap_api import API_COLUMNS
+
+DICTIONARY_KEYS = {column: key for key, column in API_COLUMNS.items()}
+
+
+def metadata_records(df):
+    # A data dictionary frame as the content=metadata JSON records REDCap
+    # returns: API keys, every value a string
+    df = df.reindex(columns=list(DICTIONARY_KEYS)).rename(columns=DICTIONARY_KEYS)
+    return df.fillna("").astype(str).to_dict("records")
+
+
+class StandinHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        server = self.server
+        length = int(self.headers.get("Content-Length", 0))
+        fields = parse_qs(self.rfile.read(length).decode())
+        token = fields.get("token", [""])[0]
+        with server.lock:
+            server.requests += 1
+            server.clients.add(self.client_address)
+            failures = server.failures.get(token, 0)
+            if failures:
+                server.failures[token] = failures - 1
+        if failures:
+            return self.reply(503, b"Service Unavailable")
+        if fields.get("content") != ["metadata"] or token not in server.projects:
+            return self.reply(
+                403,
+                json.dumps(
+                    {"error": "You do not have permissions to use the API"}
+                ).encode(),
+            )
+        self.reply(200, json.dumps(server.projects[token]).encode())
+
+    def reply(self, status, data):
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+class StandinServer(ThreadingHTTPServer):
+    """Local stand-in for a REDCap API that serves canned metadata by token."""
+
+    daemon_threads = True
+
+    def __init__(self, projects, failures=None, port=0):
+        # projects maps token -> metadata records; failures maps token -> how
+        # many requests with it get a 503 before it is served
+        super().__init__(("127.0.0.1", port), StandinHandler)
+        self.projects = projects
+        self.failures = dict(failures or {})
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.clients = set()
+        self.thread = None
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}/api/"
+
+    def start(self):
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Serve data dictionary files as a local stand-in REDCap API"
+    )
+    parser.add_argument(
+        "projects", nargs="+", metavar="TOKEN=FILE", help="token and dictionary CSV"
+    )
+    parser.add_argument("--port", type=int, default=8801)
+    args = parser.parse_args()
+    projects = {}
+    for project in args.projects:
+        token, sep, path = project.partition("=")
+        if not sep:
+            parser.error(f"{project} is not TOKEN=FILE")
+        projects[token] = metadata_records(pd.read_csv(path, dtype=str))
+    server = StandinServer(projects, port=args.port)
+    print(f"Serving {', '.join(projects)} at {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,160 @@
+import re
+import zlib
+from collections import defaultdict
+
+import numpy as np
+
+FIELD_NAME_COL = "Variable / Field Name"
+FORM_COL = "Form Name"
+FIELD_TYPE_COL = "Field Type"
+LABEL_COL = "Field Label"
+CHOICES_COL = "Choices, Calculations, OR Slider Labels"
+
+PRIME = (1 << 61) - 1
+# Weights of the label, choices, form and remaining columns in a pair's score
+WEIGHTS = (0.5, 0.2, 0.15, 0.15)
+
+
+def shingles(text, size=3):
+    text = " ".join(str(text).lower().split())
+    if len(text) <= size:
+        return frozenset([text]) if text else frozenset()
+    return frozenset(text[ind : ind + size] for ind in range(len(text) - size + 1))
+
+
+def option_set(choices):
+    return frozenset(
+        " ".join(opt.lower().split())
+        for opt in re.split(r"\|", str(choices))
+        if opt.strip()
+    )
+
+
+def jaccard(left, right):
+    if not left and not right:
+        return 1.0
+    return len(left & right) / len(left | right)
+
+
+class MinHasher:
+    """MinHash signatures of label shingles, for LSH banding."""
+
+    def __init__(self, num_perm=32, seed=0):
+        rng = np.random.default_rng(seed)
+        self.a = rng.integers(1, 2**32, num_perm, dtype=np.uint64)
+        self.b = rng.integers(0, 2**32, num_perm, dtype=np.uint64)
+
+    def signature(self, shingle_set):
+        if not shingle_set:
+            return None
+        # crc32 values and a are both below 2**32, so a * x cannot overflow
+        x = np.fromiter(
+            (zlib.crc32(s.encode()) for s in shingle_set),
+            dtype=np.uint64,
+            count=len(shingle_set),
+        )
+        return ((np.outer(x, self.a) % PRIME + self.b) % PRIME).min(axis=0)
+
+
+class Candidate:
+    __slots__ = ("pos", "form", "field_type", "label", "choices", "rest")
+
+    def __init__(self, df, pos, rest_cols):
+        self.pos = pos
+        self.form = df.at[pos, FORM_COL] if FORM_COL in df else ""
+        self.field_type = df.at[pos, FIELD_TYPE_COL] if FIELD_TYPE_COL in df else ""
+        self.label = shingles(df.at[pos, LABEL_COL]) if LABEL_COL in df else frozenset()
+        self.choices = (
+            option_set(df.at[pos, CHOICES_COL]) if CHOICES_COL in df else frozenset()
+        )
+        self.rest = tuple(df.at[pos, col] for col in rest_cols)
+
+
+def score(old, new):
+    rest = 1.0
+    if old.rest:
+        rest = sum(o == n for o, n in zip(old.rest, new.rest)) / len(old.rest)
+    label_w, choices_w, form_w, rest_w = WEIGHTS
+    return (
+        label_w * jaccard(old.label, new.label)
+        + choices_w * jaccard(old.choices, new.choices)
+        + form_w * (old.form == new.form)
+        + rest_w * rest
+    )
+
+
+def candidate_pairs(olds, news, hasher, bands, max_bucket):
+    # Only fields of the same type are compared, and only when their labels
+    # share an LSH band (or both are empty). Buckets that grow past
+    # max_bucket (boilerplate labels such as "Other, specify") are split by
+    # form so they cannot turn quadratic.
+    rows = len(hasher.a) // bands
+    buckets = defaultdict(lambda: ([], []))
+    for side, candidates in enumerate([olds, news]):
+        for cand in candidates:
+            sig = hasher.signature(cand.label)
+            if sig is None:
+                buckets[(cand.field_type, "empty")][side].append(cand)
+                continue
+            for band in range(bands):
+                key = (
+                    cand.field_type,
+                    band,
+                    sig[band * rows : (band + 1) * rows].tobytes(),
+                )
+                buckets[key][side].append(cand)
+    pairs = set()
+    for old_bucket, new_bucket in buckets.values():
+        if not old_bucket or not new_bucket:
+            continue
+        if len(old_bucket) * len(new_bucket) > max_bucket**2:
+            by_form = defaultdict(list)
+            for cand in new_bucket:
+                by_form[cand.form].append(cand)
+            for old in old_bucket:
+                pairs.update((old, new) for new in by_form.get(old.form, ()))
+            continue
+        pairs.update((old, new) for old in old_bucket for new in new_bucket)
+    return pairs
+
+
+def detect_renames(
+    df_old,
+    df_new,
+    dropped,
+    new_only,
+    threshold=0.8,
+    num_perm=32,
+    bands=16,
+    max_bucket=200,
+):
+    # Pairs dropped old rows with new-only rows whose other columns look the
+    # same. Returns [(new_pos, old_pos, score)] in new row order; every row is
+    # used at most once, best scores first.
+    if not dropped or not new_only:
+        return []
+    rest_cols = [
+        col
+        for col in df_new.columns
+        if col in df_old.columns
+        and col
+        not in (FIELD_NAME_COL, FORM_COL, FIELD_TYPE_COL, LABEL_COL, CHOICES_COL)
+    ]
+    olds = [Candidate(df_old, pos, rest_cols) for pos in dropped]
+    news = [Candidate(df_new, pos, rest_cols) for pos in new_only]
+    hasher = MinHasher(num_perm)
+    scored = []
+    for old, new in candidate_pairs(olds, news, hasher, bands, max_bucket):
+        pair_score = score(old, new)
+        if pair_score >= threshold:
+            scored.append((-pair_score, new.pos, old.pos))
+    used_old = set()
+    used_new = set()
+    renames = []
+    for neg_score, new_pos, old_pos in sorted(scored):
+        if new_pos in used_new or old_pos in used_old:
+            continue
+        used_new.add(new_pos)
+        used_old.add(old_pos)
+        renames.append((new_pos, old_pos, -neg_score))
+    return sorted(renames)
@@ -0,0 +1,227 @@
+import json
+import re
+import warnings
+
+import numpy as np
+
+# A condition is {column: spec}; spec is a value (equality), a list
+# (membership) or {"eq" | "ne" | "in" | "not_in" | "regex": value}
+OPS = {"eq", "ne", "in", "not_in", "regex"}
+
+
+class Condition:
+    __slots__ = ("column", "op", "value")
+
+    def __init__(self, column, spec):
+        if isinstance(spec, dict):
+            if len(spec) != 1:
+                raise ValueError(
+                    f"Condition on {column} must have one operator: {spec}"
+                )
+            ((op, value),) = spec.items()
+        elif isinstance(spec, list):
+            op, value = "in", spec
+        else:
+            op, value = "eq", spec
+        if op not in OPS:
+            raise ValueError(
+                f"Unknown operator {op} for {column}, use one of {sorted(OPS)}"
+            )
+        if op in ("in", "not_in") and not isinstance(value, list):
+            raise ValueError(f"Condition {op} on {column} needs a list of values")
+        if op in ("eq", "ne") and isinstance(value, (list, dict)):
+            raise ValueError(f"Condition {op} on {column} needs a single value")
+        if op == "regex":
+            try:
+                value = re.compile(value)
+            except (re.error, TypeError) as err:
+                raise ValueError(f"Bad regex for {column}: {err}") from None
+        self.column = column
+        self.op = op
+        self.value = value
+
+    def mask(self, df):
+        # Rules on a column the dictionary does not have never match, as the
+        # requester rule never matches a dictionary without requesters
+        if self.column is None or self.column not in df:
+            return np.zeros(len(df), dtype=bool)
+        values = df[self.column]
+        if self.op == "eq":
+            mask = values == self.value
+        elif self.op == "ne":
+            mask = values != self.value
+        elif self.op == "in":
+            mask = values.isin(self.value)
+        elif self.op == "not_in":
+            mask = ~values.isin(self.value)
+        else:
+            mask = values.astype(str).str.contains(self.value)
+        return mask.to_numpy(dtype=bool)
+
+
+class Rule:
+    """A conjunction of conditions on the old row, plus the columns it makes important."""
+
+    def __init__(self, name, when=None, columns=()):
+        self.name = name
+        if not isinstance(when or {}, dict):
+            raise ValueError(f"Rule {name}: when must be an object of conditions")
+        try:
+            self.conditions = [
+                Condition(col, spec) for col, spec in (when or {}).items()
+            ]
+        except ValueError as err:
+            raise ValueError(f"Rule {name}: {err}") from None
+        self.columns = list(columns)
+
+    def missing_columns(self, df):
+        return [
+            condition.column
+            for condition in self.conditions
+            if condition.column is not None and condition.column not in df
+        ]
+
+    def mask(self, df):
+        mask = np.ones(len(df), dtype=bool)
+        for condition in self.conditions:
+            mask &= condition.mask(df)
+        return mask
+
+
+class RuleMasks:
+    """Each rule evaluated once over every old row."""
+
+    def __init__(self, rule_set, df_old):
+        self.rule_set = rule_set
+        if rule_set.config is not None:
+            # Configured rules name their columns, so a missing one is a
+            # mistake; the legacy requester rule just has nothing to match
+            for rule in rule_set.dangerous_drops + rule_set.important_changes:
+                missing = rule.missing_columns(df_old)
+                if missing:
+                    warnings.warn(
+                        f"Rule {rule.name} never matches: the old dictionary has "
+                        f"no {', '.join(missing)} column"
+                    )
+        self.drop_masks = [rule.mask(df_old) for rule in rule_set.dangerous_drops]
+        self.important_masks = [
+            rule.mask(df_old) for rule in rule_set.important_changes
+        ]
+
+    def dangerous(self, positions):
+        positions = np.asarray(positions, dtype=int)
+        dangerous = np.zeros(len(positions), dtype=bool)
+        for mask in self.drop_masks:
+            dangerous |= mask[positions]
+        return dangerous
+
+    def drop_hits(self, positions):
+        positions = np.asarray(positions, dtype=int)
+        return {
+            rule.name: int(mask[positions].sum())
+            for rule, mask in zip(self.rule_set.dangerous_drops, self.drop_masks)
+        }
+
+    def important(self, old_positions, columns, changed):
+        # (important pair x column matrix, {rule: fields with an important
+        # change}) for the changed matrix of the aligned pairs
+        old_positions = np.asarray(old_positions, dtype=int)
+        important = np.zeros(changed.shape, dtype=bool)
+        hits = {}
+        for rule, mask in zip(self.rule_set.important_changes, self.important_masks):
+            rule_cells = np.outer(mask[old_positions], np.isin(columns, rule.columns))
+            rule_cells &= changed
+            important |= rule_cells
+            hits[rule.name] = int(rule_cells.any(axis=1).sum())
+        return important, hits
+
+
+class RuleSet:
+    """Dangerous-drop and important-change rules, compiled from a config."""
+
+    def __init__(self, dangerous_drops=(), important_changes=()):
+        self.dangerous_drops = list(dangerous_drops)
+        self.important_changes = list(important_changes)
+        self.config = None
+
+    @classmethod
+    def from_config(cls, config):
+        # {"dangerous_drops": [{"name", "when"}],
+        #  "important_changes": [{"name", "columns", "when"}]}
+        if not isinstance(config, dict):
+            raise ValueError("Rules config must be an object")
+        for key in ["dangerous_drops", "important_changes"]:
+            rules = config.get(key, [])
+            if not isinstance(rules, list) or not all(
+                isinstance(rule, dict) for rule in rules
+            ):
+                raise ValueError(f"{key} must be a list of rule objects")
+        for ind, rule in enumerate(config.get("important_changes", [])):
+            if not isinstance(rule.get("columns"), list) or not rule["columns"]:
+                raise ValueError(f"important_changes[{ind}] needs a list of columns")
+        rules = cls(
+            [
+                Rule(rule.get("name", f"dangerous_drop_{ind}"), rule.get("when"))
+                for ind, rule in enumerate(config.get("dangerous_drops", []))
+            ],
+            [
+                Rule(
+                    rule.get("name", f"important_change_{ind}"),
+                    rule.get("when"),
+                    rule.get("columns"),
+                )
+                for ind, rule in enumerate(config.get("important_changes", []))
+            ],
+        )
+        rules.config = config
+        return rules
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            return cls.from_config(json.load(f))
+
+    @classmethod
+    def from_legacy(
+        cls,
+        dangerous_drop_rules=None,
+        important_change_rules=None,
+        requester_col=None,
+        requester="CCDE",
+    ):
+        # The {column: [values]} and {"fields": [columns]} arguments ExcelDiff
+        # has always taken; important changes only count for fields the
+        # requester asked for
+        dangerous_drops = [
+            Rule(col, {col: {"in": list(values)}})
+            for col, values in (dangerous_drop_rules or {}).items()
+        ]
+        important_changes = []
+        if important_change_rules:
+            important_changes.append(
+                Rule(
+                    "important_fields",
+                    {requester_col: requester},
+                    important_change_rules["fields"],
+                )
+            )
+        return cls(dangerous_drops, important_changes)
+
+    def describe(self):
+        # (dangerous drops, important changes) as the report prints them
+        if self.config is not None:
+            return (
+                self.config.get("dangerous_drops", []),
+                self.config.get("important_changes", []),
+            )
+        return (
+            [rule.name for rule in self.dangerous_drops],
+            [rule.name for rule in self.important_changes],
+        )
+
+    @property
+    def important_columns(self):
+        return {col for rule in self.important_changes for col in rule.columns}
+
+    def evaluate(self, df_old):
+        return RuleMasks(self, df_old)
@@ -0,0 +1,216 @@
+import argparse
+import random
+
+import pandas as pd
+
+COLUMNS = [
+    "Variable / Field Name",
+    "Form Name",
+    "Section Header",
+    "Field Type",
+    "Field Label",
+    "Choices, Calculations, OR Slider Labels",
+    "Field Note",
+    "Text Validation Type OR Show Slider Number",
+    "Text Validation Min",
+    "Text Validation Max",
+    "Identifier?",
+    "Branching Logic (Show field only if...)",
+    "Required Field?",
+    "Custom Alignment",
+    "Question Number (surveys only)",
+    "Matrix Group Name",
+    "Matrix Ranking?",
+    "Field Annotation",
+]
+REQUESTER_COL = "Who requested this data?"
+
+FIELD_TYPES = [
+    ("text", 40),
+    ("radio", 20),
+    ("dropdown", 10),
+    ("checkbox", 8),
+    ("yesno", 6),
+    ("notes", 5),
+    ("calc", 4),
+    ("descriptive", 4),
+    ("slider", 3),
+]
+VALIDATIONS = ["", "", "", "integer", "number", "date_mdy", "email"]
+WORDS = (
+    "patient symptom onset date dose drug visit result test positive negative "
+    "history medication treatment hospital admission discharge fever cough "
+    "oxygen saturation weight height score status other specify"
+).split()
+
+
+def make_label(rng, n_words=(3, 8)):
+    return " ".join(
+        rng.choice(WORDS) for _ in range(rng.randint(*n_words))
+    ).capitalize()
+
+
+def make_choices(rng, choice_length):
+    n_options = rng.randint(*choice_length)
+    return " | ".join(
+        f"{code}, {make_label(rng, (1, 3))}" for code in range(1, n_options + 1)
+    )
+
+
+def make_row(rng, ind, form, fields, choice_length, branching_share):
+    field = f"{form}_{ind}"
+    field_type = rng.choices(
+        [name for name, _ in FIELD_TYPES], [weight for _, weight in FIELD_TYPES]
+    )[0]
+    row = dict.fromkeys(COLUMNS, "")
+    row["Variable / Field Name"] = field
+    row["Form Name"] = form
+    row["Field Type"] = field_type
+    row["Field Label"] = make_label(rng)
+    if field_type in ("radio", "dropdown", "checkbox"):
+        row["Choices, Calculations, OR Slider Labels"] = make_choices(
+            rng, choice_length
+        )
+    elif field_type == "calc" and fields:
+        refs = rng.sample(fields, min(len(fields), 2))
+        row["Choices, Calculations, OR Slider Labels"] = " + ".join(
+            f"[{ref}]" for ref in refs
+        )
+    elif field_type == "slider":
+        row["Choices, Calculations, OR Slider Labels"] = "Low | Medium | High"
+    elif field_type == "text":
+        row["Text Validation Type OR Show Slider Number"] = rng.choice(VALIDATIONS)
+    if fields and rng.random() < branching_share:
+        row["Branching Logic (Show field only if...)"] = f"[{rng.choice(fields)}] = '1'"
+    if rng.random() < 0.3:
+        row["Required Field?"] = "y"
+    if rng.random() < 0.05:
+        row["Identifier?"] = "y"
+    if rng.random() < 0.1:
+        row["Field Note"] = make_label(rng)
+    return row
+
+
+def generate_dictionary(
+    n_fields=1000, n_forms=20, choice_length=(2, 10), branching_share=0.2, seed=0
+):
+    rng = random.Random(seed)
+    rows = []
+    fields = []
+    for ind in range(n_fields):
+        form = f"form_{ind * n_forms // n_fields}"
+        row = make_row(rng, ind, form, fields[-50:], choice_length, branching_share)
+        rows.append(row)
+        fields.append(row["Variable / Field Name"])
+    return pd.DataFrame(rows, columns=COLUMNS)
+
+
+def change_row(rng, row):
+    row = dict(row)
+    kind = rng.random()
+    choices = row["Choices, Calculations, OR Slider Labels"]
+    if row["Field Type"] in ("radio", "dropdown", "checkbox") and kind < 0.4:
+        options = choices.split(" | ")
+        if rng.random() < 0.5:
+            options.append(f"{len(options) + 1}, {make_label(rng, (1, 3))}")
+        else:
+            code = rng.randrange(len(options))
+            options[code] = f"{code + 1}, {make_label(rng, (1, 3))}"
+        row["Choices, Calculations, OR Slider Labels"] = " | ".join(options)
+    elif kind < 0.7:
+        row["Field Label"] = row["Field Label"] + " (revised)"
+    elif kind < 0.85:
+        row["Required Field?"] = "" if row["Required Field?"] else "y"
+    else:
+        row["Field Note"] = make_label(rng)
+    return row
+
+
+def generate_pair(
+    n_fields=1000,
+    n_forms=20,
+    choice_length=(2, 10),
+    branching_share=0.2,
+    new_share=0.01,
+    dropped_share=0.01,
+    changed_share=0.05,
+    extra_columns=0,
+    seed=0,
+):
+    # Returns (df_old, df_new). With extra_columns the old dictionary gets the
+    # requester column plus that many annotation columns, which sends the pair
+    # through complex_diff.
+    rng = random.Random(seed + 1)
+    df_old = generate_dictionary(
+        n_fields, n_forms, choice_length, branching_share, seed
+    )
+    old_rows = df_old.to_dict("records")
+    n_dropped = int(n_fields * dropped_share)
+    dropped = set(rng.sample(range(n_fields), n_dropped))
+    new_rows = []
+    for ind, row in enumerate(old_rows):
+        if ind in dropped:
+            continue
+        if rng.random() < changed_share:
+            row = change_row(rng, row)
+        new_rows.append(row)
+    fields = [row["Variable / Field Name"] for row in new_rows]
+    for ind in range(int(n_fields * new_share)):
+        pos = rng.randrange(len(new_rows) + 1)
+        form = (
+            new_rows[min(pos, len(new_rows) - 1)]["Form Name"] if new_rows else "form_0"
+        )
+        row = make_row(
+            rng, f"new{ind}", form, fields[-50:], choice_length, branching_share
+        )
+        new_rows.insert(pos, row)
+    df_new = pd.DataFrame(new_rows, columns=COLUMNS)
+
+    if extra_columns:
+        df_old[REQUESTER_COL] = [
+            "CCDE" if rng.random() < 0.5 else "Site" for _ in range(len(df_old))
+        ]
+        for ind in range(extra_columns - 1):
+            df_old[f"Site annotation {ind + 1}"] = [
+                make_label(rng, (1, 4)) if rng.random() < 0.3 else ""
+                for _ in range(len(df_old))
+            ]
+    return df_old, df_new
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Write a synthetic old/new REDCap data dictionary pair"
+    )
+    parser.add_argument("old_path")
+    parser.add_argument("new_path")
+    parser.add_argument("--fields", type=int, default=1000)
+    parser.add_argument("--forms", type=int, default=20)
+    parser.add_argument("--choices", type=int, nargs=2, default=[2, 10])
+    parser.add_argument("--branching", type=float, default=0.2)
+    parser.add_argument("--new", type=float, default=0.01)
+    parser.add_argument("--dropped", type=float, default=0.01)
+    parser.add_argument("--changed", type=float, default=0.05)
+    parser.add_argument("--extra-columns", type=int, default=0)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    df_old, df_new = generate_pair(
+        args.fields,
+        args.forms,
+        tuple(args.choices),
+        args.branching,
+        args.new,
+        args.dropped,
+        args.changed,
+        args.extra_columns,
+        args.seed,
+    )
+    for df, path in [(df_old, args.old_path), (df_new, args.new_path)]:
+        if path.endswith(".csv"):
+            df.to_csv(path, index=False)
+        else:
+            df.to_excel(path, index=False)
+
+
+if __name__ == "__main__":
+    main()
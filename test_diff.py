@@ -0,0 +1,201 @@
+import json
+import sys
+import tempfile
+import unittest
+import warnings
+from contextlib import redirect_stderr
+from io import StringIO
+from pathlib import Path
+
+from openpyxl import load_workbook
+
+import diff
+from excel_diff import ExcelDiff
+from outofcore import OutOfCoreDiff
+from rules import RuleSet
+
+FIXTURES = Path(__file__).parent / "fixtures"
+# name -> (old, new) inputs; fixtures/{name}_expected.json is the workbook
+# they diff to
+PAIRS = {
+    "simple": ("simple_old.csv", "simple_new.csv"),
+    "complex": ("complex_old.xlsx", "complex_new.csv"),
+}
+# Sheets whose every cell is kept in the expected output; DIFF, NEW, OLD and
+# the auxiliary sheets are copies of the inputs, so only their size and
+# highlighted cells are
+NOTES_SHEETS = {"CHANGE_NOTES", "NEW_CHANGE_NOTES"}
+RULES = {
+    "dangerous_drops": [{"name": "identifiers", "when": {"Identifier?": "y"}}],
+    "important_changes": [
+        {
+            "name": "choice_fields",
+            "columns": ["Field Label", "Choices, Calculations, OR Slider Labels"],
+            "when": {"Field Type": {"in": ["radio", "checkbox"]}},
+        }
+    ],
+}
+
+
+def fill(cell):
+    return cell.fill.fgColor.rgb if cell.fill.fill_type else None
+
+
+def workbook_cells(path):
+    # {sheet: [[cell, value, fill], ...]} of every cell with a value or fill,
+    # plus the rows highlighted as a whole
+    workbook = load_workbook(path)
+    sheets = {}
+    for worksheet in workbook.worksheets:
+        sheets[worksheet.title] = {
+            "rows": worksheet.max_row,
+            "columns": worksheet.max_column,
+            "row_fills": sorted(
+                [row, dims.fill.fgColor.rgb]
+                for row, dims in worksheet.row_dimensions.items()
+                if dims.fill.fill_type
+            ),
+            "cells": [
+                [cell.coordinate, cell.value, fill(cell)]
+                for row in worksheet.iter_rows()
+                for cell in row
+                if cell.value is not None or fill(cell)
+            ],
+        }
+    return sheets
+
+
+def expected_cells(sheets):
+    # What the checked-in expected output keeps of workbook_cells
+    return {
+        name: dict(
+            sheet,
+            cells=[cell for cell in sheet["cells"] if name in NOTES_SHEETS or cell[2]],
+        )
+        for name, sheet in sheets.items()
+    }
+
+
+def diff_workbook(name, path, streaming=False, rules=None):
+    old, new = PAIRS[name]
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        ExcelDiff(
+            FIXTURES / old,
+            FIXTURES / new,
+            filename=str(path.with_suffix("")),
+            streaming=streaming,
+            rules=rules,
+        ).diff()
+    return workbook_cells(path)
+
+
+def out_of_core_workbook(name, path, chunk_rows, rules=None):
+    old, new = PAIRS[name]
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        with OutOfCoreDiff(
+            FIXTURES / old, FIXTURES / new, chunk_rows, rules=rules
+        ) as diff_class:
+            diff_class.diff(path)
+    return workbook_cells(path)
+
+
+class ReportTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dir = Path(self.tmp.name)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_matches_expected(self):
+        for name in PAIRS:
+            with self.subTest(name):
+                with open(FIXTURES / f"{name}_expected.json") as f:
+                    expected = json.load(f)
+                sheets = diff_workbook(name, self.dir / f"{name}.xlsx")
+                self.assertEqual(expected_cells(sheets), expected)
+
+    def test_writers_agree(self):
+        # Streaming, in-memory and out-of-core (in chunks smaller than the
+        # inputs) write the same workbook, with the default and custom rules
+        for name in PAIRS:
+            for rules in [None, RuleSet.from_config(RULES)]:
+                with self.subTest(name, rules=rules is not None):
+                    in_memory = diff_workbook(name, self.dir / "a.xlsx", rules=rules)
+                    streaming = diff_workbook(
+                        name, self.dir / "b.xlsx", streaming=True, rules=rules
+                    )
+                    out_of_core = out_of_core_workbook(
+                        name, self.dir / "c.xlsx", 7, rules=rules
+                    )
+                    self.assertEqual(streaming, in_memory)
+                    self.assertEqual(out_of_core, in_memory)
+
+    def test_bad_rules(self):
+        for when in [
+            {"Field Type": {"in": "radio"}},
+            {"Field Type": {"not_in": "radio"}},
+            {"Field Type": {"eq": ["radio"]}},
+            {"Field Type": {"ne": ["radio", "text"]}},
+            {"Field Type": {"regex": "("}},
+            {"Field Type": {"like": "radio"}},
+            ["Field Type"],
+        ]:
+            with self.subTest(when=when):
+                with self.assertRaisesRegex(ValueError, "Rule bad"):
+                    RuleSet.from_config(
+                        {"dangerous_drops": [{"name": "bad", "when": when}]}
+                    )
+        path = self.dir / "rules.json"
+        path.write_text(
+            json.dumps({"dangerous_drops": [{"name": "bad", "when": when}]})
+        )
+        status, stderr = run_cli(
+            FIXTURES / "simple_old.csv", FIXTURES / "simple_new.csv", "--rules", path
+        )
+        self.assertEqual(status, 2)
+        self.assertIn("could not load rules", stderr)
+
+    def test_chunk_rows(self):
+        for chunk_rows in [0, -1, 2.5]:
+            with self.assertRaises(ValueError):
+                OutOfCoreDiff("old.csv", "new.csv", chunk_rows)
+        for chunk_rows in ["0", "x"]:
+            status, stderr = run_cli(
+                FIXTURES / "simple_old.csv",
+                FIXTURES / "simple_new.csv",
+                "--out-of-core",
+                "--chunk-rows",
+                chunk_rows,
+            )
+            self.assertEqual(status, 2)
+            self.assertIn("--chunk-rows", stderr)
+
+
+def run_cli(*args):
+    stderr = StringIO()
+    with redirect_stderr(stderr):
+        try:
+            status = diff.main(["diff.py", *map(str, args)])
+        except SystemExit as err:
+            status = err.code
+    return status, stderr.getvalue()
+
+
+def write_expected():
+    # Rewrites fixtures/*_expected.json after an intended change to the report
+    with tempfile.TemporaryDirectory() as tmp:
+        for name in PAIRS:
+            sheets = diff_workbook(name, Path(tmp) / f"{name}.xlsx")
+            with open(FIXTURES / f"{name}_expected.json", "w") as f:
+                json.dump(expected_cells(sheets), f, indent=1)
+                f.write("\n")
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] == ["--write-expected"]:
+        write_expected()
+    else:
+        unittest.main()
@@ -0,0 +1,137 @@
+import json
+import tempfile
+import unittest
+from contextlib import redirect_stderr
+from io import StringIO
+from pathlib import Path
+
+import diff
+from excel_diff import ExcelDiff
+from redcap_api import (
+    API_COLUMNS,
+    RedcapClient,
+    RedcapError,
+    RedcapProject,
+    load_projects,
+)
+from redcap_standin import StandinServer, metadata_records
+from synthetic import generate_pair
+
+
+class RedcapClientTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dir = Path(self.tmp.name)
+        self.df_old, self.df_new = generate_pair(200, seed=3)
+        self.df_old.to_csv(self.dir / "old.csv", index=False)
+        self.df_new.to_csv(self.dir / "new.csv", index=False)
+        self.server = StandinServer(
+            {
+                "old-token": metadata_records(self.df_old),
+                "new-token": metadata_records(self.df_new),
+            }
+        ).start()
+        self.client = RedcapClient(timeout=5, retries=2, backoff=0)
+
+    def tearDown(self):
+        self.server.stop()
+        self.tmp.cleanup()
+
+    def write_projects(self, config):
+        path = self.dir / "projects.json"
+        path.write_text(json.dumps(config))
+        return path
+
+    def test_fetch_metadata(self):
+        df = self.client.fetch_metadata(self.server.url, "new-token")
+        self.assertEqual(df.columns.tolist(), list(API_COLUMNS.values()))
+        self.assertEqual(
+            df["Variable / Field Name"].tolist(),
+            self.df_new["Variable / Field Name"].tolist(),
+        )
+
+    def test_retries_reuse_connection(self):
+        self.server.failures["new-token"] = 2
+        self.client.fetch_metadata(self.server.url, "new-token")
+        self.client.fetch_metadata(self.server.url, "old-token")
+        self.assertEqual(self.server.requests, 4)
+        self.assertEqual(len(self.server.clients), 1)
+
+    def test_retries_exhausted(self):
+        self.server.failures["new-token"] = 3
+        with self.assertRaisesRegex(RedcapError, "HTTP 503"):
+            self.client.fetch_metadata(self.server.url, "new-token")
+
+    def test_bad_token_not_retried(self):
+        with self.assertRaisesRegex(RedcapError, "permissions"):
+            self.client.fetch_metadata(self.server.url, "wrong-token")
+        self.assertEqual(self.server.requests, 1)
+
+    def test_fetch_all_reports_every_failure(self):
+        projects = [
+            RedcapProject(name, self.server.url, token, self.client)
+            for name, token in [("a", "old-token"), ("b", "x"), ("c", "y")]
+        ]
+        with self.assertRaises(RedcapError) as raised:
+            self.client.fetch_all(projects)
+        self.assertIn("b:", str(raised.exception))
+        self.assertIn("c:", str(raised.exception))
+
+    def test_diff_matches_files(self):
+        project = RedcapProject("new", self.server.url, "new-token", self.client)
+        from_api = ExcelDiff(self.dir / "old.csv", project).compute()
+        from_file = ExcelDiff(self.dir / "old.csv", self.dir / "new.csv").compute()
+        self.assertEqual(len(from_api.new_rows), len(from_file.new_rows))
+        self.assertEqual(len(from_api.dropped_rows), len(from_file.dropped_rows))
+        self.assertEqual(list(from_api.changes), list(from_file.changes))
+
+    def test_load_projects(self):
+        path = self.write_projects(
+            {"covid": {"url": self.server.url, "token_env": "STANDIN_TOKEN"}}
+        )
+        with self.assertRaisesRegex(ValueError, "No API token"):
+            load_projects(path)
+        for config in [[], {"covid": {"token": "t"}}]:
+            with self.assertRaises(ValueError):
+                load_projects(self.write_projects(config))
+
+    def run_cli(self, *args):
+        stderr = StringIO()
+        with redirect_stderr(stderr):
+            try:
+                status = diff.main(["diff.py", *map(str, args)])
+            except SystemExit as err:
+                status = err.code
+        return status, stderr.getvalue()
+
+    def test_cli_errors(self):
+        bad = self.dir / "bad.json"
+        bad.write_text("{not json")
+        status, stderr = self.run_cli(
+            self.dir / "old.csv",
+            "redcap:covid",
+            "--projects",
+            bad,
+            "--check",
+            "--no-cache",
+        )
+        self.assertEqual(status, 2)
+        self.assertIn("could not load projects", stderr)
+
+        projects = self.write_projects(
+            {"covid": {"url": self.server.url, "token": "wrong-token"}}
+        )
+        status, stderr = self.run_cli(
+            self.dir / "old.csv",
+            "redcap:covid",
+            "--projects",
+            projects,
+            "--check",
+            "--no-cache",
+        )
+        self.assertEqual(status, 1)
+        self.assertIn("permissions", stderr)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,38 @@
+import json
+import time
+from contextlib import contextmanager
+
+
+class StageTimer:
+    """Wall time and row/cell counts for each stage of a diff."""
+
+    def __init__(self, hooks=()):
+        self.stages = []
+        self.hooks = list(hooks)
+
+    def add_hook(self, hook):
+        # hook(record) is called with each stage's record as the stage ends
+        self.hooks.append(hook)
+
+    @contextmanager
+    def stage(self, name, **counts):
+        # The record is yielded so counts only known at the end can be added
+        record = {"stage": name, **counts}
+        start = time.perf_counter()
+        try:
+            yield record
+        finally:
+            record["seconds"] = time.perf_counter() - start
+            self.stages.append(record)
+            for hook in self.hooks:
+                hook(record)
+
+    def report(self):
+        return {
+            "stages": self.stages,
+            "total_seconds": sum(record["seconds"] for record in self.stages),
+        }
+
+    def write_report(self, path):
+        with open(path, "w") as f:
+            json.dump(self.report(), f, indent=2, default=int)
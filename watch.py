@@ -0,0 +1,269 @@
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlparse
+
+from cache import DictionaryCache
+from excel_diff import AUX_SHEETS, ExcelDiff, ExcelReport, FieldIndex, read_dictionary
+from timing import StageTimer
+
+EXTENSIONS = {".csv", ".xlsx"}
+
+
+class BaselineWatcher:
+    """Diffs exports against a baseline dictionary kept parsed and indexed in memory."""
+
+    def __init__(
+        self,
+        baseline_path,
+        directory=None,
+        promote=False,
+        output_dir=None,
+        cache=None,
+        detect_renames=False,
+    ):
+        self.directory = Path(directory) if directory else None
+        self.promote = promote
+        self.output_dir = Path(output_dir) if output_dir else None
+        self.cache = cache
+        self.detect_renames = detect_renames
+        self.lock = threading.RLock()
+        # path -> (size, mtime) of files already diffed, and of files seen on
+        # the last poll that are diffed once they stop changing
+        self.seen = {}
+        self.pending = {}
+        self.outputs = set()
+        self.latest = None
+        self.baseline_path = None
+        self.df_old = None
+        self.aux = {}
+        self.old_index = None
+        self.set_baseline(baseline_path)
+
+    def set_baseline(self, path, df=None, aux=None):
+        if df is None:
+            # Only the baseline goes through the cache, so a restart is fast
+            # without filling it with every export
+            if self.cache is None:
+                df, aux = read_dictionary(path, AUX_SHEETS)
+            else:
+                df, aux = self.cache.read(path, AUX_SHEETS, read_dictionary)
+        df = df.reset_index(drop=True)
+        with self.lock:
+            self.baseline_path = Path(path)
+            self.df_old = df
+            self.aux = dict(aux or {})
+            self.old_index = FieldIndex(df)
+
+    def diff(self, path, promote=False, render=False):
+        # Workbooks are only written for watched exports (render=True); the
+        # HTTP endpoint returns JSON after the compare step alone
+        timer = StageTimer()
+        with timer.stage("read", file="new") as stage:
+            df_new, _ = read_dictionary(path)
+            stage["rows"], stage["columns"] = df_new.shape
+        with self.lock:
+            baseline = str(self.baseline_path)
+            diff_class = ExcelDiff(
+                self.baseline_path,
+                path,
+                timer=timer,
+                detect_renames=self.detect_renames,
+            )
+            diff_class.set_frames(self.df_old, df_new)
+            diff_class.aux_sheets = dict(self.aux)
+            diff_class.old_index = self.old_index
+            result = diff_class.compute()
+            if promote:
+                self.set_baseline(path, df_new, {})
+        if render and self.output_dir is not None:
+            self.output_dir.mkdir(parents=True, exist_ok=True)
+            fname = self.output_dir / f"{Path(path).stem}_DIFF.xlsx"
+            self.outputs.add(fname.resolve())
+            ExcelReport(result, timer=timer).save(str(fname))
+        report = {
+            "baseline": baseline,
+            "export": str(path),
+            "promoted": promote,
+            "result": result.to_dict(),
+            "timings": timer.report(),
+        }
+        self.latest = report
+        return report
+
+    def exports(self):
+        for entry in os.scandir(self.directory):
+            path = Path(entry.path)
+            if (
+                not entry.is_file()
+                or path.suffix not in EXTENSIONS
+                or path.name.startswith((".", "~$"))
+                or path.resolve() in self.outputs
+                or path.resolve() == self.baseline_path.resolve()
+            ):
+                continue
+            stat = entry.stat()
+            yield path, (stat.st_size, stat.st_mtime_ns)
+
+    def skip_existing(self):
+        # Exports already in the directory at start up are not new
+        self.seen.update(self.exports())
+
+    def poll(self):
+        # A file is diffed once its size and mtime are unchanged between two
+        # polls, so exports still being copied in are left alone
+        reports = []
+        for path, state in sorted(self.exports(), key=lambda item: item[1][1]):
+            if self.seen.get(path) == state:
+                continue
+            if self.pending.get(path) != state:
+                self.pending[path] = state
+                continue
+            del self.pending[path]
+            self.seen[path] = state
+            try:
+                reports.append(self.diff(path, promote=self.promote, render=True))
+            except Exception as err:
+                print(f"Could not diff {path}: {err}", file=sys.stderr)
+        return reports
+
+    def watch(self, interval=2.0, stop=None):
+        stop = stop or threading.Event()
+        while not stop.is_set():
+            for report in self.poll():
+                print_report(report)
+            stop.wait(interval)
+
+
+def print_report(report):
+    result = report["result"]
+    print(
+        f"{report['export']}: {len(result['new_rows'])} new, "
+        f"{len(result['dropped_rows'])} dropped, {len(result['changes'])} changed "
+        f"({report['timings']['total_seconds']:.2f} s)"
+        + (", promoted to baseline" if report["promoted"] else ""),
+        flush=True,
+    )
+
+
+def make_handler(watcher):
+    class DiffHandler(BaseHTTPRequestHandler):
+        # GET /status, GET /latest, GET /diff?path=<export> and
+        # POST /diff?name=<export.csv|.xlsx> with the export as the body.
+        # None of them promote the export to the baseline.
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            if url.path == "/status":
+                with watcher.lock:
+                    self.send_json(
+                        {
+                            "baseline": str(watcher.baseline_path),
+                            "fields": len(watcher.old_index),
+                            "directory": str(watcher.directory),
+                            "diffed": len(watcher.seen),
+                        }
+                    )
+            elif url.path == "/latest":
+                if watcher.latest is None:
+                    self.send_json({"error": "nothing diffed yet"}, 404)
+                else:
+                    self.send_json(watcher.latest)
+            elif url.path == "/diff":
+                paths = parse_qs(url.query).get("path")
+                if not paths:
+                    self.send_json({"error": "path is required"}, 400)
+                    return
+                self.send_diff(paths[0])
+            else:
+                self.send_json({"error": "not found"}, 404)
+
+        def do_POST(self):
+            url = urlparse(self.path)
+            if url.path != "/diff":
+                self.send_json({"error": "not found"}, 404)
+                return
+            name = parse_qs(url.query).get("name", ["export.csv"])[0]
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            fd, tmp = tempfile.mkstemp(suffix=os.path.splitext(name)[1])
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    f.write(body)
+                self.send_diff(tmp)
+            finally:
+                os.remove(tmp)
+
+        def send_diff(self, path):
+            try:
+                report = watcher.diff(path)
+            except Exception as err:
+                self.send_json({"error": str(err)}, 400)
+                return
+            self.send_json(report)
+
+        def send_json(self, body, status=200):
+            data = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format, *args):
+            pass
+
+    return DiffHandler
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Watch a folder and diff each new export against a baseline kept in memory"
+    )
+    parser.add_argument("baseline", help="baseline data dictionary (.xlsx or .csv)")
+    parser.add_argument("directory", help="folder new exports are dropped into")
+    parser.add_argument(
+        "--promote",
+        action="store_true",
+        help="make each diffed export the baseline for the next one",
+    )
+    parser.add_argument("--output", help="also write a DIFF workbook per export here")
+    parser.add_argument(
+        "--interval", type=float, default=2.0, help="seconds between polls"
+    )
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument(
+        "--port", type=int, default=8765, help="JSON endpoint port, 0 to disable"
+    )
+    parser.add_argument("--no-cache", action="store_true")
+    parser.add_argument("--detect-renames", action="store_true")
+    args = parser.parse_args()
+
+    watcher = BaselineWatcher(
+        args.baseline,
+        args.directory,
+        promote=args.promote,
+        output_dir=args.output,
+        cache=None if args.no_cache else DictionaryCache(),
+        detect_renames=args.detect_renames,
+    )
+    watcher.skip_existing()
+    if args.port:
+        server = ThreadingHTTPServer((args.host, args.port), make_handler(watcher))
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        print(f"Serving diffs on http://{args.host}:{server.server_address[1]}")
+    print(
+        f"Watching {args.directory} against {args.baseline} ({len(watcher.old_index)} fields)"
+    )
+    try:
+        watcher.watch(args.interval)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()